@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from datetime import timedelta
 from pathlib import Path
+from typing import Any, Dict
 
 from dotenv import load_dotenv
 
@@ -128,6 +129,18 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Хэширование паролей: Argon2 считается параллельно в несколько потоков и не держит
+# воркер так долго, как PBKDF2. Старые PBKDF2-хэши проверяются и перехэшируются при входе.
+# https://docs.djangoproject.com/en/5.2/topics/auth/passwords/#using-argon2-with-django
+
+PRODUCTION_PASSWORD_HASHERS = [
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+PASSWORD_HASHERS = PRODUCTION_PASSWORD_HASHERS
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -158,7 +171,7 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.SessionAuthentication",
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CustomJWTAuthentication",
         "rest_framework.authentication.TokenAuthentication",
     ],
     "DEFAULT_FILTER_BACKENDS": [
@@ -169,7 +182,8 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 20,
     # Форматы данных
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
+        # orjson кодирует ответы в несколько раз быстрее стандартного json
+        "drf_orjson_renderer.renderers.ORJSONRenderer",
         "rest_framework.renderers.BrowsableAPIRenderer",  # Для удобного просмотра в браузере
     ],
     "DEFAULT_PARSER_CLASSES": [
@@ -213,6 +227,29 @@ SPECTACULAR_SETTINGS = {
     "SERVE_INCLUDE_SCHEMA": False,
 }
 
+# Логирование: по умолчанию только предупреждения и ошибки приложений,
+# информационные сообщения включаются LOG_LEVEL=INFO, отладочные - LOG_LEVEL=DEBUG
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING")
+LOGGING: Dict[str, Any] = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "users": {"handlers": ["console"], "level": LOG_LEVEL},
+        "materials": {"handlers": ["console"], "level": LOG_LEVEL},
+    },
+}
+
+# Кэш (Redis): общий для веб-процессов и воркеров Celery
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("CACHE_URL", "redis://localhost:6379/1"),
+    }
+}
+
 # Celery Configuration
 CELERY_BROKER_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -0,0 +1,18 @@
+"""
+Настройки для запуска тестов.
+manage.py test подключает их по умолчанию, явно: --settings=eduflow.test_settings.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+# Медленное хеширование паролей - основная стоимость create_user, в тестах используется быстрый MD5
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+# Кэш в памяти процесса: тесты не требуют Redis, а cache.clear() не очищает общую базу CACHE_URL
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# Вывод тестов не засоряется сообщениями задач, даже если LOG_LEVEL=INFO задан в .env
+LOGGING = {
+    **LOGGING,  # noqa: F405
+    "loggers": {name: {**config, "level": "WARNING"} for name, config in LOGGING["loggers"].items()},  # noqa: F405
+}
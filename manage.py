@@ -6,7 +6,9 @@ import sys
 
 def main() -> None:
     """Run administrative tasks."""
-    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "eduflow.settings")
+    # manage.py test по умолчанию запускается с тестовыми настройками
+    default_settings = "eduflow.test_settings" if sys.argv[1:2] == ["test"] else "eduflow.settings"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", default_settings)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-15 23:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0003_course_price"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="stripe_price_amount",
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name="Сумма цены в Stripe"),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="stripe_price_id",
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name="ID цены в Stripe"),
+        ),
+        migrations.AddField(
+            model_name="course",
+            name="stripe_product_id",
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name="ID продукта в Stripe"),
+        ),
+    ]
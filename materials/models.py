@@ -25,6 +25,11 @@ class Course(models.Model):
     created_at = models.DateTimeField(_("created at"), auto_now_add=True)
     updated_at = models.DateTimeField(_("updated at"), auto_now=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Цена курса")
+    # Продукт и цена в Stripe создаются один раз и переиспользуются при следующих оплатах;
+    # при изменении цены курса создается новая цена (сравнивается stripe_price_amount)
+    stripe_product_id = models.CharField(max_length=255, blank=True, null=True, verbose_name="ID продукта в Stripe")
+    stripe_price_id = models.CharField(max_length=255, blank=True, null=True, verbose_name="ID цены в Stripe")
+    stripe_price_amount = models.PositiveIntegerField(blank=True, null=True, verbose_name="Сумма цены в Stripe")
 
     class Meta:
         verbose_name = _("course")
@@ -114,10 +114,12 @@ class LessonModelYouTubeValidationTests(TestCase):
 class LessonSerializerYouTubeValidationTests(TestCase):
     """Тесты валидации YouTube ссылок на уровне сериализатора"""
 
-    def setUp(self) -> None:
-        self.User = get_user_model()
-        self.user = self.User.objects.create_user(email="test@example.com", password="testpass123")
-        self.course = Course.objects.create(title="Test Course", owner=self.user)
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка тестовых данных (один раз на класс)"""
+        cls.User = get_user_model()
+        cls.user = cls.User.objects.create_user(email="test@example.com", password="testpass123")
+        cls.course = Course.objects.create(title="Test Course", owner=cls.user)
 
     def test_serializer_with_valid_youtube_url(self) -> None:
         """Сериализатор принимает валидную YouTube ссылку"""
@@ -138,13 +140,15 @@ class LessonSerializerYouTubeValidationTests(TestCase):
 class LessonIntegrationTests(TestCase):
     """Интеграционные тесты для уроков"""
 
-    def setUp(self) -> None:
-        self.User = get_user_model()
-        self.user = self.User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка тестовых данных (один раз на класс)"""
+        cls.User = get_user_model()
+        cls.user = cls.User.objects.create_user(
             email="teacher@example.com", password="testpass123", first_name="John", last_name="Doe"
         )
 
-        self.course = Course.objects.create(title="Test Course", description="Test Description", owner=self.user)
+        cls.course = Course.objects.create(title="Test Course", description="Test Description", owner=cls.user)
 
     def test_create_lesson_with_youtube_url(self) -> None:
         """Интеграционный тест создания урока с YouTube ссылкой"""
@@ -170,9 +174,11 @@ class LessonIntegrationTests(TestCase):
 class CourseModelTests(TestCase):
     """Тесты для модели Course"""
 
-    def setUp(self) -> None:
-        self.User = get_user_model()
-        self.user = self.User.objects.create_user(email="creator@example.com", password="testpass123")
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка тестовых данных (один раз на класс)"""
+        cls.User = get_user_model()
+        cls.user = cls.User.objects.create_user(email="creator@example.com", password="testpass123")
 
     def test_course_creation(self) -> None:
         """Тест создания курса"""
@@ -191,15 +197,19 @@ class CourseModelTests(TestCase):
 class CourseViewSetAPITests(APITestCase):
     """API тесты для CourseViewSet"""
 
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка тестовых данных (один раз на класс)"""
+        cls.User = get_user_model()
+        cls.user = cls.User.objects.create_user(email="teacher@example.com", password="testpass123")
+        cls.other_user = cls.User.objects.create_user(email="other@example.com", password="testpass123")
+
+        cls.course = Course.objects.create(title="Test Course", description="Test Description", owner=cls.user)
+
     def setUp(self) -> None:
-        self.User = get_user_model()
-        self.user = self.User.objects.create_user(email="teacher@example.com", password="testpass123")
-        self.other_user = self.User.objects.create_user(email="other@example.com", password="testpass123")
         self.client = APIClient()
         self.client.force_authenticate(user=self.user)
 
-        self.course = Course.objects.create(title="Test Course", description="Test Description", owner=self.user)
-
     def test_create_course(self) -> None:
         """Тест создания курса"""
         url = "/api/courses/"
@@ -225,47 +235,48 @@ class LessonCRUDTestCase(APITestCase):
     Тестирование CRUD операций для уроков с разными правами доступа.
     """
 
-    def setUp(self) -> None:
-        """Заполнение базы данных тестовыми данными"""
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Заполнение базы данных тестовыми данными (один раз на класс)"""
         # Создаем группу модераторов
-        self.moderator_group, created = Group.objects.get_or_create(name="moderators")
+        cls.moderator_group, created = Group.objects.get_or_create(name="moderators")
 
         # Создаем пользователей с разными ролями
-        self.regular_user = User.objects.create_user(
+        cls.regular_user = User.objects.create_user(
             email="regular@test.com", password="testpass123", first_name="Regular", last_name="User"
         )
 
-        self.moderator_user = User.objects.create_user(
+        cls.moderator_user = User.objects.create_user(
             email="moderator@test.com", password="testpass123", first_name="Moderator", last_name="User"
         )
-        self.moderator_user.groups.add(self.moderator_group)
+        cls.moderator_user.groups.add(cls.moderator_group)
 
-        self.admin_user = User.objects.create_user(
+        cls.admin_user = User.objects.create_user(
             email="admin@test.com", password="testpass123", first_name="Admin", last_name="User", is_staff=True
         )
 
         # Создаем курс
-        self.course = Course.objects.create(
-            title="Test Course", description="Test Course Description", owner=self.regular_user
+        cls.course = Course.objects.create(
+            title="Test Course", description="Test Course Description", owner=cls.regular_user
         )
 
         # Создаем уроки
-        self.lesson1 = Lesson.objects.create(
-            title="Lesson 1", description="Lesson 1 Description", course=self.course, owner=self.regular_user, order=1
+        cls.lesson1 = Lesson.objects.create(
+            title="Lesson 1", description="Lesson 1 Description", course=cls.course, owner=cls.regular_user, order=1
         )
 
-        self.lesson2 = Lesson.objects.create(
-            title="Lesson 2", description="Lesson 2 Description", course=self.course, owner=self.regular_user, order=2
+        cls.lesson2 = Lesson.objects.create(
+            title="Lesson 2", description="Lesson 2 Description", course=cls.course, owner=cls.regular_user, order=2
         )
 
         # Создаем урок другого пользователя
-        self.other_user = User.objects.create_user(email="other@test.com", password="testpass123")
+        cls.other_user = User.objects.create_user(email="other@test.com", password="testpass123")
 
-        self.other_lesson = Lesson.objects.create(
+        cls.other_lesson = Lesson.objects.create(
             title="Other Lesson",
             description="Other Lesson Description",
-            course=self.course,
-            owner=self.other_user,
+            course=cls.course,
+            owner=cls.other_user,
             order=3,
         )
 
@@ -359,12 +370,13 @@ class SubscriptionTestCase(APITestCase):
     Тестирование функционала подписки на обновления курса.
     """
 
-    def setUp(self) -> None:
-        """Заполнение базы данных тестовыми данными"""
-        self.user = User.objects.create_user(email="user@test.com", password="testpass123")
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Заполнение базы данных тестовыми данными (один раз на класс)"""
+        cls.user = User.objects.create_user(email="user@test.com", password="testpass123")
 
-        self.course = Course.objects.create(
-            title="Test Course for Subscription", description="Test Course Description", owner=self.user
+        cls.course = Course.objects.create(
+            title="Test Course for Subscription", description="Test Course Description", owner=cls.user
         )
 
     def test_subscribe_to_course(self) -> None:
@@ -426,19 +438,21 @@ class LessonSerializerTestCase(TestCase):
     Тестирование сериализатора уроков.
     """
 
-    def setUp(self) -> None:
-        self.user = User.objects.create_user(email="serializer@test.com", password="testpass123")
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка тестовых данных (один раз на класс)"""
+        cls.user = User.objects.create_user(email="serializer@test.com", password="testpass123")
 
-        self.course = Course.objects.create(
-            title="Serializer Course", description="Serializer Course Description", owner=self.user
+        cls.course = Course.objects.create(
+            title="Serializer Course", description="Serializer Course Description", owner=cls.user
         )
 
-        self.lesson_data = {
+        cls.lesson_data = {
             "title": "Serializer Lesson",
             "description": "Serializer Lesson Description",
-            "course": self.course.id,
+            "course": cls.course.id,
             "order": 1,
-            "owner": self.user.id,
+            "owner": cls.user.id,
         }
 
     def test_lesson_serializer_valid_data(self) -> None:
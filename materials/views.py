@@ -11,7 +11,7 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 
 from users.models import Subscription
-from users.permissions import CanCreateContent, CanDeleteContent, IsOwnerOrModerator
+from users.permissions import CanCreateContent, CanDeleteContent, IsOwnerOrModerator, is_moderator
 
 from .models import Course, Lesson
 from .serializers import CourseSerializer, LessonSerializer
@@ -142,7 +142,7 @@ class CourseViewSet(viewsets.ModelViewSet):
 
         user = self.request.user
 
-        if user.is_staff or user.groups.filter(name="moderators").exists():
+        if user.is_staff or is_moderator(self.request):
             # Модераторы и админы видят все курсы
             return Course.objects.all().prefetch_related("lessons")
         else:
@@ -320,7 +320,7 @@ class LessonViewSet(viewsets.ModelViewSet):
 
         user = self.request.user
 
-        if user.is_staff or user.groups.filter(name="moderators").exists():
+        if user.is_staff or is_moderator(self.request):
             return Lesson.objects.all().select_related("course", "owner")
         else:
             return Lesson.objects.filter(owner=user).select_related("course", "owner")
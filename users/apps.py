@@ -6,3 +6,7 @@ class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "users"
     verbose_name = _("Users")
+
+    def ready(self) -> None:
+        # Регистрируем обработчики сигналов
+        from . import signals  # noqa: F401
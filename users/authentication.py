@@ -0,0 +1,34 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import User
+
+
+class CustomJWTAuthentication(JWTAuthentication):
+    """
+    JWT-аутентификация, загружающая пользователя вместе с флагом is_moderator,
+    чтобы проверки прав не обращались к группам отдельным запросом.
+    """
+
+    def get_user(self, validated_token: Token) -> User:
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken("Token contained no recognizable user identification") from e
+
+        try:
+            user: User = User.objects.with_moderator_flag().get(**{api_settings.USER_ID_FIELD: user_id})
+        except User.DoesNotExist as e:
+            raise AuthenticationFailed("User not found", code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+
+        return user
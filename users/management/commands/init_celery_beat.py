@@ -1,59 +1,113 @@
-from typing import Any
+import json
+from typing import Any, Dict, List, Tuple
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from django_celery_beat.models import IntervalSchedule, PeriodicTask
+from django_celery_beat.models import CrontabSchedule, PeriodicTask, PeriodicTasks
+
+from users.tasks import schedule_payment_check
+
+# Расписания: (ключ, minute, hour, day_of_week). Crontab срабатывает в фиксированное время,
+# поэтому после рестарта beat задачи не запускаются все разом, как при IntervalSchedule.
+SCHEDULES = [
+    ("hourly", "30", "*", "*"),
+    ("daily", "0", "3", "*"),
+    ("weekly", "0", "4", "1"),
+]
+
+# Периодические задачи: (ключ расписания, name, task, kwargs, enabled, description)
+TASKS: List[Tuple[str, str, str, Dict[str, Any], bool, str]] = [
+    (
+        "hourly",
+        "Ensure payment status check is scheduled",
+        "users.tasks.ensure_payment_check_scheduled",
+        {},
+        True,
+        "Перезапуск цепочки check_payment_status, если ее очередной запуск потерян",
+    ),
+    (
+        "daily",
+        "Cleanup old data daily",
+        "users.tasks.cleanup_old_data",
+        {},
+        True,
+        "Очистка старых данных каждый день",
+    ),
+    (
+        "weekly",
+        "Deactivate inactive users weekly",
+        "users.tasks.deactivate_inactive_users",
+        {},
+        True,
+        "Деактивация пользователей, не заходивших более 30 дней (еженедельно)",
+    ),
+]
 
 
 class Command(BaseCommand):
     help = "Setup periodic tasks for Celery Beat"
 
     def handle(self, *args: Any, **options: Any) -> None:
-        # Создание интервалов
-        every_10_minutes, _ = IntervalSchedule.objects.get_or_create(
-            every=10,
-            period=IntervalSchedule.MINUTES,
-        )
+        # Создание расписаний: одним запросом читаем существующие, недостающие создаем пачкой
+        wanted = {(minute, hour, day_of_week) for _, minute, hour, day_of_week in SCHEDULES}
+        existing = {
+            (crontab.minute, crontab.hour, crontab.day_of_week): crontab
+            for crontab in CrontabSchedule.objects.filter(
+                minute__in={minute for minute, _, _ in wanted},
+                hour__in={hour for _, hour, _ in wanted},
+                day_of_week__in={day_of_week for _, _, day_of_week in wanted},
+                day_of_month="*",
+                month_of_year="*",
+                timezone=settings.CELERY_TIMEZONE,
+            )
+        }
+        missing = [
+            CrontabSchedule(
+                minute=minute,
+                hour=hour,
+                day_of_week=day_of_week,
+                day_of_month="*",
+                month_of_year="*",
+                timezone=settings.CELERY_TIMEZONE,
+            )
+            for minute, hour, day_of_week in wanted - existing.keys()
+        ]
+        for crontab in CrontabSchedule.objects.bulk_create(missing):
+            existing[(crontab.minute, crontab.hour, crontab.day_of_week)] = crontab
 
-        every_hour, _ = IntervalSchedule.objects.get_or_create(
-            every=1,
-            period=IntervalSchedule.HOURS,
-        )
+        crontabs = {key: existing[(minute, hour, day_of_week)] for key, minute, hour, day_of_week in SCHEDULES}
 
-        every_day, _ = IntervalSchedule.objects.get_or_create(
-            every=1,
-            period=IntervalSchedule.DAYS,
+        # Создание периодических задач одним INSERT ... ON CONFLICT (name) DO UPDATE.
+        # interval сбрасывается в NULL, чтобы перевести ранее созданные задачи на crontab.
+        # enabled не перезаписывается, чтобы не сбрасывать ручное включение/отключение задач.
+        PeriodicTask.objects.bulk_create(
+            [
+                PeriodicTask(
+                    name=name,
+                    crontab=crontabs[schedule_key],
+                    interval=None,
+                    task=task,
+                    kwargs=json.dumps(kwargs),
+                    enabled=enabled,
+                    description=description,
+                )
+                for schedule_key, name, task, kwargs, enabled, description in TASKS
+            ],
+            update_conflicts=True,
+            unique_fields=["name"],
+            update_fields=["crontab", "interval", "task", "kwargs", "description"],
         )
+        # check_payment_status больше не запускается через Beat: удаляем старую запись
+        PeriodicTask.objects.filter(name="Check payment status hourly").delete()
 
-        every_week, _ = IntervalSchedule.objects.get_or_create(
-            every=1,
-            period=IntervalSchedule.DAYS,
-        )
+        # bulk_create не вызывает сигналы, поэтому явно сообщаем Celery Beat об изменениях
+        PeriodicTasks.update_changed()
 
-        # Задача: проверка статуса платежей каждый час
-        PeriodicTask.objects.get_or_create(
-            interval=every_hour,
-            name="Check payment status hourly",
-            task="users.tasks.check_payment_status",
-            defaults={"description": "Проверка статуса pending платежей каждый час"},
-        )
-
-        # Задача: очистка старых данных каждый день
-        PeriodicTask.objects.get_or_create(
-            interval=every_day,
-            name="Cleanup old data daily",
-            task="users.tasks.cleanup_old_data",
-            defaults={"description": "Очистка старых данных каждый день"},
-        )
-
-        # Задача: деактивация неактивных пользователей каждую неделю
-        PeriodicTask.objects.get_or_create(
-            interval=every_week,
-            name="Deactivate inactive users weekly",
-            task="users.tasks.deactivate_inactive_users",
-            defaults={
-                "description": "Деактивация пользователей, не заходивших более 30 дней (еженедельно)",
-                "enabled": True,
-            },
-        )
+        # Запускаем самопланирующуюся цепочку проверки платежей. Без брокера команда не падает:
+        # цепочку запустит задача ensure_payment_check_scheduled при ближайшем срабатывании Beat
+        try:
+            schedule_payment_check()
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f"Цепочка проверки платежей не запущена: {e}"))
 
         self.stdout.write(self.style.SUCCESS("Successfully setup periodic tasks"))
@@ -0,0 +1,29 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django_celery_beat.models import PeriodicTask, PeriodicTasks
+
+
+class Command(BaseCommand):
+    help = "Enable or disable Celery Beat periodic tasks by name"
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument("names", nargs="+", help="Names of periodic tasks")
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument("--enable", action="store_true", help="Enable the given tasks")
+        group.add_argument("--disable", action="store_true", help="Disable the given tasks")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        names = options["names"]
+        enabled = options["enable"]
+
+        # Один UPDATE на все задачи вместо сохранения каждой по отдельности
+        updated = PeriodicTask.objects.filter(name__in=names).update(enabled=enabled)
+        if not updated:
+            raise CommandError(f"Периодические задачи не найдены: {', '.join(names)}")
+
+        # update() не вызывает сигналы, поэтому явно сообщаем Celery Beat об изменениях
+        PeriodicTasks.update_changed()
+
+        state = "включено" if enabled else "отключено"
+        self.stdout.write(self.style.SUCCESS(f"Задач {state}: {updated} из {len(names)}"))
@@ -1,6 +1,7 @@
 from typing import Any
 
 from django.contrib.auth.base_user import BaseUserManager
+from django.db.models import Exists, OuterRef, QuerySet
 from django.utils.translation import gettext_lazy as _
 
 
@@ -35,3 +36,11 @@ class CustomUserManager(BaseUserManager):
         if extra_fields.get("is_superuser") is not True:
             raise ValueError(_("Superuser must have is_superuser=True."))
         return self.create_user(email, password, **extra_fields)
+
+    def with_moderator_flag(self) -> QuerySet:
+        """
+        Возвращает пользователей с аннотацией is_moderator,
+        вычисленной подзапросом EXISTS в том же SQL-запросе.
+        """
+        memberships = self.model.groups.through.objects.filter(user=OuterRef("pk"), group__name="moderators")
+        return self.get_queryset().annotate(is_moderator=Exists(memberships))
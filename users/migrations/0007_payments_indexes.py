@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-15 22:46
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы строятся через CREATE INDEX CONCURRENTLY, что невозможно внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ("materials", "0003_course_price"),
+        ("users", "0006_alter_payments_options_payments_payment_status_and_more"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="payments",
+            index=models.Index(fields=["payment_status", "-payment_date"], name="pay_status_date_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="payments",
+            index=models.Index(fields=["user", "-payment_date"], name="pay_user_date_idx"),
+        ),
+    ]
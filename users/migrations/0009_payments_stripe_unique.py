@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-15 22:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0003_course_price"),
+        ("users", "0007_payments_indexes"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="payments",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(
+                    ("stripe_payment_intent_id__isnull", False),
+                    models.Q(("stripe_payment_intent_id", ""), _negated=True),
+                ),
+                fields=("stripe_payment_intent_id",),
+                name="uniq_stripe_intent",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="payments",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(
+                    ("stripe_session_id__isnull", False), models.Q(("stripe_session_id", ""), _negated=True)
+                ),
+                fields=("stripe_session_id",),
+                name="uniq_stripe_session",
+            ),
+        ),
+    ]
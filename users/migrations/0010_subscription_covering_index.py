@@ -0,0 +1,77 @@
+# Generated by Django 5.2.8 on 2026-10-15 22:54
+
+from typing import Any
+
+from django.db import migrations, models
+
+SUBSCRIPTION_UNIQUE = models.UniqueConstraint(
+    fields=("user", "course"), include=("created_at",), name="sub_user_course_uniq"
+)
+
+
+def create_unique_index(apps: Any, schema_editor: Any) -> None:
+    """На PostgreSQL уникальный индекс строится CONCURRENTLY, не блокируя запись в таблицу подписок."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Subscription = apps.get_model("users", "Subscription")
+    schema_editor.execute(
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s (%s, %s) INCLUDE (%s)"
+        % (
+            schema_editor.quote_name(SUBSCRIPTION_UNIQUE.name),
+            schema_editor.quote_name(Subscription._meta.db_table),
+            schema_editor.quote_name("user_id"),
+            schema_editor.quote_name("course_id"),
+            schema_editor.quote_name("created_at"),
+        )
+    )
+
+
+def drop_unique_index(apps: Any, schema_editor: Any) -> None:
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.remove_constraint(apps.get_model("users", "Subscription"), SUBSCRIPTION_UNIQUE)
+
+
+def create_fallback_unique_index(apps: Any, schema_editor: Any) -> None:
+    """
+    БД без INCLUDE (SQLite в локальной разработке) пропускают покрывающий UniqueConstraint,
+    поэтому на них уникальность пары обеспечивает обычный уникальный индекс. Создается SQL-запросом
+    после AlterUniqueTogether: SQLite пересоздает таблицу по состоянию модели, в котором этого индекса нет.
+    """
+    if schema_editor.connection.vendor == "postgresql":
+        return
+    Subscription = apps.get_model("users", "Subscription")
+    schema_editor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS %s ON %s (%s, %s)"
+        % (
+            schema_editor.quote_name(SUBSCRIPTION_UNIQUE.name),
+            schema_editor.quote_name(Subscription._meta.db_table),
+            schema_editor.quote_name("user_id"),
+            schema_editor.quote_name("course_id"),
+        )
+    )
+
+
+def drop_fallback_unique_index(apps: Any, schema_editor: Any) -> None:
+    if schema_editor.connection.vendor != "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS %s" % schema_editor.quote_name(SUBSCRIPTION_UNIQUE.name))
+
+
+class Migration(migrations.Migration):
+    # Индекс строится через CREATE INDEX CONCURRENTLY, что невозможно внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ("materials", "0003_course_price"),
+        ("users", "0009_payments_stripe_unique"),
+    ]
+
+    operations = [
+        # Сначала строится новый уникальный индекс, затем удаляется unique_together:
+        # уникальность пары (user, course) обеспечена на всем протяжении миграции
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(create_unique_index, drop_unique_index)],
+            state_operations=[migrations.AddConstraint(model_name="subscription", constraint=SUBSCRIPTION_UNIQUE)],
+        ),
+        migrations.AlterUniqueTogether(name="subscription", unique_together=set()),
+        migrations.RunPython(create_fallback_unique_index, drop_fallback_unique_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-15 22:56
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0010_subscription_covering_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payments",
+            name="amount_cents",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.db.models.functions.comparison.Cast(
+                    django.db.models.expressions.CombinedExpression(models.F("amount"), "*", models.Value(100)),
+                    output_field=models.BigIntegerField(),
+                ),
+                output_field=models.BigIntegerField(),
+                verbose_name="Сумма в центах",
+            ),
+        ),
+    ]
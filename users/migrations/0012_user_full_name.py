@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-15 22:58
+
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0011_payments_amount_cents"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="full_name",
+            field=models.GeneratedField(
+                db_index=True,
+                db_persist=True,
+                expression=django.db.models.functions.comparison.Coalesce(
+                    django.db.models.functions.comparison.NullIf(
+                        django.db.models.functions.text.Trim(
+                            django.db.models.functions.text.Concat("first_name", models.Value(" "), "last_name")
+                        ),
+                        models.Value(""),
+                    ),
+                    models.F("email"),
+                ),
+                output_field=models.CharField(max_length=301),
+                verbose_name="full name",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-15 23:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0012_user_full_name"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="payments",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="payments",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Пользователь",
+            ),
+        ),
+    ]
@@ -1,8 +1,11 @@
-from typing import List
+from functools import cached_property
+from typing import FrozenSet, List
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import F, Q, Value
+from django.db.models.functions import Cast, Coalesce, Concat, NullIf, Trim
 from django.utils.translation import gettext_lazy as _
 
 from .managers import CustomUserManager
@@ -20,6 +23,16 @@ class User(AbstractUser):
         _("avatar"), upload_to="users/avatars/", blank=True, null=True, help_text=_("Upload your profile picture")
     )
 
+    # Полное имя вычисляется БД, поэтому всегда согласовано с именем и email, в том числе после
+    # QuerySet.update() и bulk_create; хранится в столбце для сортировки и поиска по индексу
+    full_name = models.GeneratedField(
+        expression=Coalesce(NullIf(Trim(Concat("first_name", Value(" "), "last_name")), Value("")), F("email")),
+        output_field=models.CharField(max_length=301),
+        db_persist=True,
+        db_index=True,
+        verbose_name=_("full name"),
+    )
+
     # Устанавливаем кастомный менеджер
     objects = CustomUserManager()
 
@@ -34,11 +47,13 @@ class User(AbstractUser):
     def __str__(self) -> str:
         return str(self.email)
 
-    @property
-    def full_name(self) -> str:
-        """Возвращает полное имя пользователя."""
-        name = f"{self.first_name} {self.last_name}".strip()
-        return name if name else str(self.email)
+    @cached_property
+    def group_names(self) -> FrozenSet[str]:
+        """
+        Возвращает названия групп пользователя (один запрос на экземпляр).
+        groups.all() использует prefetch_related("groups"), если он был сделан.
+        """
+        return frozenset(group.name for group in self.groups.all())
 
 
 class Payments(models.Model):
@@ -55,11 +70,24 @@ class Payments(models.Model):
         ("refunded", "Возвращено"),
     ]
 
+    # Отдельный индекс по user не нужен: его покрывает составной индекс pay_user_date_idx
     user = models.ForeignKey(
-        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="payments", verbose_name="Пользователь"
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="payments",
+        db_index=False,
+        verbose_name="Пользователь",
     )
     payment_date = models.DateTimeField(auto_now_add=True, verbose_name="Дата платежа")
     amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Сумма")
+    # Сумма в копейках/центах: целочисленный столбец для быстрых SUM/AVG в отчетах,
+    # вычисляется БД из amount и не требует синхронизации в коде
+    amount_cents = models.GeneratedField(
+        expression=Cast(F("amount") * 100, output_field=models.BigIntegerField()),
+        output_field=models.BigIntegerField(),
+        db_persist=True,
+        verbose_name="Сумма в центах",
+    )
     payment_method = models.CharField(
         max_length=20, choices=PAYMENT_METHOD_CHOICES, default="cash", verbose_name="Способ оплаты"
     )
@@ -91,6 +119,23 @@ class Payments(models.Model):
         verbose_name = "Платеж"
         verbose_name_plural = "Платежи"
         ordering = ["-payment_date"]
+        indexes = [
+            models.Index(fields=["payment_status", "-payment_date"], name="pay_status_date_idx"),
+            models.Index(fields=["user", "-payment_date"], name="pay_user_date_idx"),
+        ]
+        # Пустые строки, как и NULL, означают отсутствие идентификатора и под уникальность не попадают
+        constraints = [
+            models.UniqueConstraint(
+                fields=["stripe_payment_intent_id"],
+                condition=Q(stripe_payment_intent_id__isnull=False) & ~Q(stripe_payment_intent_id=""),
+                name="uniq_stripe_intent",
+            ),
+            models.UniqueConstraint(
+                fields=["stripe_session_id"],
+                condition=Q(stripe_session_id__isnull=False) & ~Q(stripe_session_id=""),
+                name="uniq_stripe_session",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"Платеж {self.amount} от {self.user.email}"
@@ -111,7 +156,11 @@ class Subscription(models.Model):
     class Meta:
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
-        unique_together = ["user", "course"]
+        constraints = [
+            # Уникальный покрывающий индекс (PostgreSQL INCLUDE): один B-tree и для уникальности пары,
+            # и для выборок подписок пользователя с датой подписки через index-only scan
+            models.UniqueConstraint(fields=["user", "course"], include=["created_at"], name="sub_user_course_uniq"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.user.email} подписан на {self.course.title}"
@@ -1,9 +1,66 @@
-from typing import Any
+from typing import Any, Optional
 
+from django.core.cache import cache
 from django.db.models import Model
 from rest_framework import permissions
 from rest_framework.request import Request
 
+# Безопасные методы (GET, HEAD, OPTIONS) для проверки вхождения за O(1)
+_SAFE_METHODS = frozenset(permissions.SAFE_METHODS)
+
+# Методы редактирования, которые модераторы могут выполнять над чужим контентом
+_EDIT_METHODS = frozenset({"PUT", "PATCH"})
+
+# Время жизни закэшированного признака модератора, секунды
+MODERATOR_CACHE_TIMEOUT = 5 * 60
+
+
+def moderator_cache_key(user_id: int) -> str:
+    """Ключ кэша с признаком модератора для пользователя."""
+    return f"user:{user_id}:is_moderator"
+
+
+def _cached_moderator_flag(user: Any) -> bool:
+    """
+    Возвращает признак модератора из кэша Django, при промахе читает группы из БД.
+    Кэш сбрасывается сигналами при изменении групп пользователя (users/signals.py).
+    """
+    key = moderator_cache_key(user.pk)
+    cached: Optional[bool] = cache.get(key)
+    if cached is not None:
+        return cached
+    flag: bool = "moderators" in user.group_names
+    cache.set(key, flag, MODERATOR_CACHE_TIMEOUT)
+    return flag
+
+
+def is_moderator(request: Request) -> bool:
+    """
+    Проверяет, состоит ли пользователь запроса в группе модераторов.
+    Результат кэшируется на объекте запроса, чтобы классы прав и get_queryset
+    представлений в рамках одного запроса делали не более одного SQL-запроса.
+    """
+    cached = getattr(request, "_is_moderator", None)
+    if cached is None:
+        user = request.user
+        if user and user.is_authenticated:
+            # Пользователь, загруженный через User.objects.with_moderator_flag(), уже несет флаг
+            flag = getattr(user, "is_moderator", None)
+            cached = bool(flag) if flag is not None else _cached_moderator_flag(user)
+        else:
+            cached = False
+        request._is_moderator = cached
+    return cached
+
+
+def _is_owner(request: Request, obj: Any) -> bool:
+    """
+    Проверяет, принадлежит ли объект пользователю запроса.
+    Сравнивает owner_id, не загружая связанный объект owner из БД.
+    """
+    owner_id = getattr(obj, "owner_id", None)
+    return owner_id is not None and owner_id == request.user.pk
+
 
 class IsModerator(permissions.BasePermission):
     """
@@ -16,8 +73,8 @@ class IsModerator(permissions.BasePermission):
         if not request.user or not request.user.is_authenticated:
             return False
 
-        # Проверяем, является ли пользователь модератором
-        return bool(request.user.groups.filter(name="moderators").exists())  # ← ЯВНОЕ ПРЕОБРАЗОВАНИЕ
+        # Модератор определяется так же, как в остальных классах прав: по группе moderators
+        return is_moderator(request)
 
 
 class IsOwner(permissions.BasePermission):
@@ -28,9 +85,7 @@ class IsOwner(permissions.BasePermission):
 
     def has_object_permission(self, request: Request, view: Any, obj: Any) -> bool:
         # Проверяем, является ли пользователь владельцем объекта
-        if hasattr(obj, "owner"):
-            return obj.owner == request.user  # type: ignore
-        return False
+        return _is_owner(request, obj)
 
 
 class IsOwnerOrModerator(permissions.BasePermission):
@@ -44,21 +99,18 @@ class IsOwnerOrModerator(permissions.BasePermission):
         Проверяет права доступа к конкретному объекту.
         """
         # Разрешаем безопасные методы (GET, HEAD, OPTIONS) для всех авторизованных
-        if request.method in permissions.SAFE_METHODS:
+        if request.method in _SAFE_METHODS:
             return True
 
         # Для PUT, PATCH - разрешаем владельцу или модератору
-        if request.method in ["PUT", "PATCH"]:
-            can_edit: bool = (
-                obj.owner == request.user
-                or request.user.groups.filter(name="moderators").exists()
-                or request.user.is_staff
-            )
+        if request.method in _EDIT_METHODS:
+            # Сначала дешевые проверки в памяти, запрос к группам - последним
+            can_edit: bool = _is_owner(request, obj) or request.user.is_staff or is_moderator(request)
             return can_edit
 
         # Для DELETE - только владелец или админ
         if request.method == "DELETE":
-            can_delete: bool = obj.owner == request.user or request.user.is_staff
+            can_delete: bool = _is_owner(request, obj) or request.user.is_staff
             return can_delete
 
         return False
@@ -75,7 +127,7 @@ class CanCreateContent(permissions.BasePermission):
         Проверяет права доступа для создания контента.
         """
         # Модераторы не могут создавать контент
-        if request.user.groups.filter(name="moderators").exists():
+        if is_moderator(request):
             return False
         return True
 
@@ -90,7 +142,7 @@ class CanDeleteContent(permissions.BasePermission):
         """
         Проверяет права доступа для удаления объекта.
         """
-        can_delete_object: bool = obj.owner == request.user or request.user.is_staff
+        can_delete_object: bool = _is_owner(request, obj) or request.user.is_staff
         return can_delete_object
 
 
@@ -107,7 +159,7 @@ class CanViewUserProfile(permissions.BasePermission):
 
     def has_object_permission(self, request: Request, view: Any, obj: Any) -> bool:
         # Любой авторизованный пользователь может просматривать любой профиль
-        if request.method in permissions.SAFE_METHODS:
+        if request.method in _SAFE_METHODS:
             return True
         return False
 
@@ -125,7 +177,7 @@ class CanEditUserProfile(permissions.BasePermission):
             return True
 
         # Модераторы и админы могут редактировать любой профиль
-        if request.user.groups.filter(name="moderators").exists() or request.user.is_staff:
+        if request.user.is_staff or is_moderator(request):
             return True
 
         return False
@@ -138,7 +190,5 @@ class IsModeratorOrAdmin(permissions.BasePermission):
 
     def has_permission(self, request: Request, view: Any) -> bool:
         return bool(
-            request.user
-            and request.user.is_authenticated
-            and (request.user.is_staff or request.user.groups.filter(name="moderators").exists())
+            request.user and request.user.is_authenticated and (request.user.is_staff or is_moderator(request))
         )
@@ -1,28 +1,37 @@
-from typing import Any, Dict
+import logging
+from operator import attrgetter
+from typing import Any, Dict, Optional, Set
 
 from django.contrib.auth.password_validation import validate_password
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, QuerySet
 from rest_framework import serializers
+from rest_framework.request import Request
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
 
 from materials.models import Course
 
 from .models import Payments, Subscription, User  # Добавляем Subscription
+from .services.stripe_service import StripeService
+
+logger = logging.getLogger(__name__)
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     """Кастомный сериализатор для JWT с авторизацией по email"""
 
     def validate(self, attrs: Dict[str, Any]) -> Dict[str, str]:
-        print(f"🔧 JWT Auth attempt: {attrs.get('email')}")
+        # Ленивое %-форматирование: при выключенном DEBUG строки не собираются
+        logger.debug("JWT auth attempt: %s", attrs.get("email"))
 
         # Упрощенная версия - используем стандартную логику
         try:
             data = super().validate(attrs)
-            print(f"✅ JWT Auth successful for: {self.user.email}")
+            logger.debug("JWT auth successful for: %s", self.user.email)
             return data
         except Exception as e:
-            print(f"❌ JWT Auth failed: {e}")
+            logger.debug("JWT auth failed: %s", e)
             raise
 
 
@@ -50,6 +59,69 @@ class PaymentsSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "payment_date"]
 
 
+class PaymentsReadSerializer(serializers.Serializer):
+    """
+    Облегченный сериализатор платежей только для чтения (история платежей в профиле).
+    Поля объявлены явно, поэтому DRF не строит их по модели при каждом создании сериализатора.
+    Вывод совпадает с PaymentsSerializer (поля остаются для схемы API).
+    """
+
+    id = serializers.IntegerField(read_only=True)
+    user = serializers.IntegerField(source="user_id", read_only=True)
+    payment_date = serializers.DateTimeField(read_only=True)
+    paid_course = serializers.IntegerField(source="paid_course_id", read_only=True)
+    paid_lesson = serializers.IntegerField(source="paid_lesson_id", read_only=True)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    payment_method = serializers.CharField(read_only=True)
+    payment_status = serializers.CharField(read_only=True)
+    stripe_payment_intent_id = serializers.CharField(read_only=True)
+    stripe_session_id = serializers.CharField(read_only=True)
+
+    _ATTRS = attrgetter(
+        "id",
+        "user_id",
+        "payment_date",
+        "paid_course_id",
+        "paid_lesson_id",
+        "amount",
+        "payment_method",
+        "payment_status",
+        "stripe_payment_intent_id",
+        "stripe_session_id",
+    )
+
+    def to_representation(self, instance: Payments) -> Dict[str, Any]:
+        """
+        Быстрый путь вместо обхода self.fields: все значения читаются одним attrgetter,
+        через поля DRF форматируются только дата и сумма.
+        """
+        (
+            pk,
+            user_id,
+            payment_date,
+            paid_course_id,
+            paid_lesson_id,
+            amount,
+            payment_method,
+            payment_status,
+            stripe_payment_intent_id,
+            stripe_session_id,
+        ) = self._ATTRS(instance)
+        fields = self.fields
+        return {
+            "id": pk,
+            "user": user_id,
+            "payment_date": fields["payment_date"].to_representation(payment_date) if payment_date else None,
+            "paid_course": paid_course_id,
+            "paid_lesson": paid_lesson_id,
+            "amount": fields["amount"].to_representation(amount) if amount is not None else None,
+            "payment_method": payment_method,
+            "payment_status": payment_status,
+            "stripe_payment_intent_id": stripe_payment_intent_id,
+            "stripe_session_id": stripe_session_id,
+        }
+
+
 class SubscriptionSerializer(serializers.ModelSerializer):
     course_title = serializers.CharField(source="course.title", read_only=True)
     subscribed_at = serializers.DateTimeField(source="created_at", read_only=True)
@@ -59,15 +131,24 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         fields = ["id", "user", "course", "course_title", "subscribed_at"]
         read_only_fields = ["id", "user", "course_title", "subscribed_at"]
 
-    def validate(self, attrs: Dict[str, Any]) -> Dict[str, Any]:
-        """Проверяем, что пользователь не подписан дважды на один курс"""
-        user = self.context["request"].user
-        course = attrs["course"]
-
-        if Subscription.objects.filter(user=user, course=course).exists():
-            raise serializers.ValidationError("Вы уже подписаны на этот курс")
-
-        return attrs
+    def create(self, validated_data: Dict[str, Any]) -> Subscription:
+        """
+        Создание подписки идемпотентно: сначала выполняется INSERT (один запрос в обычном случае),
+        а если unique_together (user, course) уже нарушен, возвращается существующая подписка.
+        Признак создания сохраняется в self.created.
+        """
+        try:
+            # Точка сохранения, чтобы ошибка INSERT не ломала внешнюю транзакцию
+            with transaction.atomic():
+                subscription: Subscription = super().create(validated_data)
+        except IntegrityError:
+            self.created = False
+            existing: Subscription = Subscription.objects.get(
+                user=validated_data["user"], course=validated_data["course"]
+            )
+            return existing
+        self.created = True
+        return subscription
 
 
 class PublicUserProfileSerializer(serializers.ModelSerializer):
@@ -81,6 +162,22 @@ class PublicUserProfileSerializer(serializers.ModelSerializer):
         fields = ["id", "email", "first_name", "city", "avatar", "date_joined"]
         read_only_fields = ["id", "email", "date_joined"]
 
+    @classmethod
+    def setup_eager_loading(cls, queryset: QuerySet[User], request: Optional[Request] = None) -> QuerySet[User]:
+        """Загружает только публичные столбцы: хеш пароля и служебные поля не читаются"""
+        return queryset.only(*cls.Meta.fields)
+
+
+# Время жизни закэшированного ответа /users/me/, секунды.
+# Кэш сбрасывается сигналами при изменении пользователя и его платежей (users/signals.py);
+# массовые QuerySet.update() сигналы не вызывают, их устаревание ограничено этим временем
+PROFILE_CACHE_TIMEOUT = 5 * 60
+
+
+def profile_cache_key(user_id: int) -> str:
+    """Ключ кэша с ответом /users/me/ пользователя."""
+    return f"user:{user_id}:me"
+
 
 class PrivateUserProfileSerializer(serializers.ModelSerializer):
     """
@@ -88,7 +185,12 @@ class PrivateUserProfileSerializer(serializers.ModelSerializer):
     Включает все данные пользователя, включая историю платежей.
     """
 
-    payments = PaymentsSerializer(many=True, read_only=True)
+    payments = PaymentsReadSerializer(many=True, read_only=True)
+
+    # Загружаем только столбцы, которые выводит сериализатор платежей
+    PAYMENTS_PREFETCH = Prefetch(
+        "payments", queryset=Payments.objects.only(*PaymentsSerializer.Meta.fields).order_by("-payment_date")
+    )
 
     class Meta:
         model = User
@@ -108,6 +210,33 @@ class PrivateUserProfileSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["id", "email", "date_joined", "last_login", "is_active", "is_staff", "payments"]
 
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # Параметр ?fields=id,email ограничивает набор выводимых полей
+        requested = self.requested_fields(self.context.get("request"))
+        if requested is not None:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+    @staticmethod
+    def requested_fields(request: Optional[Request]) -> Optional[Set[str]]:
+        """Возвращает поля из параметра запроса fields или None, если параметр не передан"""
+        raw = request.query_params.get("fields") if request is not None else None
+        if not raw:
+            return None
+        return {name.strip() for name in raw.split(",") if name.strip()}
+
+    @classmethod
+    def setup_eager_loading(cls, queryset: QuerySet[User], request: Optional[Request] = None) -> QuerySet[User]:
+        """
+        Подгружает платежи одним запросом на весь queryset вместо запроса на каждого пользователя.
+        Если платежи не запрошены в ?fields=, prefetch не выполняется.
+        """
+        requested = cls.requested_fields(request)
+        if requested is not None and "payments" not in requested:
+            return queryset
+        return queryset.prefetch_related(cls.PAYMENTS_PREFETCH)
+
 
 class UserUpdateSerializer(serializers.ModelSerializer):
     """Сериализатор для обновления профиля пользователя"""
@@ -133,22 +262,16 @@ class UserCreateSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data: Dict[str, Any]) -> User:
-        validated_data.pop("password_confirm")
-        password = validated_data.pop("password")
-
-        # Создаем пользователя без пароля
-        user = User(
+        # Поля передаются явно, password_confirm в модель не попадает и из словаря не удаляется
+        user: User = User.objects.create_user(
             email=validated_data["email"],
+            password=validated_data["password"],
             first_name=validated_data.get("first_name", ""),
             last_name=validated_data.get("last_name", ""),
             phone=validated_data.get("phone", ""),
             city=validated_data.get("city", ""),
             avatar=validated_data.get("avatar"),
         )
-
-        # Устанавливаем пароль отдельно
-        user.set_password(password)
-        user.save()
         return user
 
 
@@ -159,14 +282,20 @@ class CoursePaymentSerializer(serializers.Serializer):
 
     course_id = serializers.IntegerField()
 
-    def validate_course_id(self, value: int) -> int:
+    def validate(self, attrs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Проверяет курс и кладет его в validated_data["course"],
+        чтобы представлению не пришлось загружать курс повторно.
+        """
         try:
-            course = Course.objects.get(id=value)
-            if not hasattr(course, "price") or not course.price:
-                raise serializers.ValidationError("Курс не имеет установленной цены")
-            return value
+            # Загружаем только поля, нужные для оплаты, без превью и служебных столбцов
+            course = Course.objects.only(*StripeService.COURSE_FIELDS).get(id=attrs["course_id"])
         except Course.DoesNotExist:
-            raise serializers.ValidationError("Курс не найден")
+            raise serializers.ValidationError({"course_id": "Курс не найден"})
+        if not course.price:
+            raise serializers.ValidationError({"course_id": "Курс не имеет установленной цены"})
+        attrs["course"] = course
+        return attrs
 
 
 class PaymentSessionSerializer(serializers.Serializer):
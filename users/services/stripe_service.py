@@ -1,18 +1,43 @@
-from typing import Any, Dict, Optional
+from typing import TYPE_CHECKING, Any, Dict, Optional
 
 import stripe
 from django.conf import settings
+from django.core.cache import cache
 
-from materials.models import Course
+if TYPE_CHECKING:
+    from materials.models import Course
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
+# Окно, в течение которого повторный запрос оплаты курса получает уже созданную сессию, секунды
+CHECKOUT_IDEMPOTENCY_TIMEOUT = 60
+
+# Значение ключа, пока первый запрос еще создает платеж и сессию в Stripe
+CHECKOUT_PENDING = "pending"
+
+
+def checkout_cache_key(user_id: int, course_id: int) -> str:
+    """Ключ кэша с последней сессией оплаты курса пользователем."""
+    return f"checkout:{user_id}:{course_id}"
+
 
 class StripeService:
     """
     Сервис для работы с Stripe API
     """
 
+    # Поля курса, которые читает create_course_payment_session; вызывающему коду достаточно
+    # загрузить курс через Course.objects.only(*StripeService.COURSE_FIELDS)
+    COURSE_FIELDS = (
+        "id",
+        "title",
+        "description",
+        "price",
+        "stripe_product_id",
+        "stripe_price_id",
+        "stripe_price_amount",
+    )
+
     @staticmethod
     def create_product(name: str, description: str = "") -> stripe.Product:
         """
@@ -68,18 +93,51 @@ class StripeService:
             raise Exception(f"Ошибка создания сессии оплаты в Stripe: {str(e)}")
 
     @staticmethod
-    def create_course_payment_session(course: Course, user_id: int) -> Dict[str, Any]:
+    def get_recent_course_payment_session(course_id: int, user_id: int) -> Optional[Dict[str, Any]]:
         """
-        Создание сессии оплаты для курса
+        Возвращает сессию оплаты, созданную для пользователя и курса в последние
+        CHECKOUT_IDEMPOTENCY_TIMEOUT секунд (защита от двойного нажатия "Оплатить").
         """
-        # Создаем продукт в Stripe
-        product = StripeService.create_product(name=course.title, description=course.description or "Оплата курса")
+        session_data = cache.get(checkout_cache_key(user_id, course_id))
+        return session_data if isinstance(session_data, dict) else None
 
-        # Создаем цену (предполагаем что курс имеет поле price)
-        price = StripeService.create_price(
-            product_id=product.id,
-            amount=int(course.price) if hasattr(course, "price") and course.price else 1000,  # 10.00 USD по умолчанию
-        )
+    @staticmethod
+    def claim_course_payment_session(course_id: int, user_id: int) -> bool:
+        """
+        Атомарно занимает ключ оплаты курса (cache.add, SETNX в Redis) до создания платежа и сессии.
+        Возвращает False, если сессия уже создана или создается параллельным запросом.
+        """
+        return bool(cache.add(checkout_cache_key(user_id, course_id), CHECKOUT_PENDING, CHECKOUT_IDEMPOTENCY_TIMEOUT))
+
+    @staticmethod
+    def release_course_payment_session(course_id: int, user_id: int) -> None:
+        """Освобождает ключ оплаты курса, если сессию создать не удалось."""
+        cache.delete(checkout_cache_key(user_id, course_id))
+
+    @staticmethod
+    def create_course_payment_session(course: "Course", user_id: int) -> Dict[str, Any]:
+        """
+        Создание сессии оплаты для курса.
+        Курс может быть загружен только с полями COURSE_FIELDS.
+        """
+        amount = int(course.price) if hasattr(course, "price") and course.price else 1000  # 10.00 USD по умолчанию
+        update_fields = []
+
+        # Продукт создается в Stripe один раз на курс
+        if not course.stripe_product_id:
+            product = StripeService.create_product(name=course.title, description=course.description or "Оплата курса")
+            course.stripe_product_id = product.id
+            update_fields.append("stripe_product_id")
+
+        # Цена переиспользуется, пока не изменилась цена курса
+        if not course.stripe_price_id or course.stripe_price_amount != amount:
+            price = StripeService.create_price(product_id=course.stripe_product_id, amount=amount)
+            course.stripe_price_id = price.id
+            course.stripe_price_amount = amount
+            update_fields += ["stripe_price_id", "stripe_price_amount"]
+
+        if update_fields:
+            course.save(update_fields=update_fields)
 
         # Создаем сессию оплаты
         success_url = f"{settings.FRONTEND_URL}/payment/success?session_id={{CHECKOUT_SESSION_ID}}"
@@ -88,7 +146,15 @@ class StripeService:
         metadata = {"course_id": str(course.id), "user_id": str(user_id), "type": "course"}
 
         session = StripeService.create_checkout_session(
-            price_id=price.id, success_url=success_url, cancel_url=cancel_url, metadata=metadata
+            price_id=course.stripe_price_id, success_url=success_url, cancel_url=cancel_url, metadata=metadata
         )
 
-        return {"session_id": session.id, "url": session.url, "product_id": product.id, "price_id": price.id}
+        session_data = {
+            "session_id": session.id,
+            "url": session.url,
+            "product_id": course.stripe_product_id,
+            "price_id": course.stripe_price_id,
+        }
+        # Сессия заменяет метку CHECKOUT_PENDING, повторные запросы получат ее из кэша
+        cache.set(checkout_cache_key(user_id, course.id), session_data, CHECKOUT_IDEMPOTENCY_TIMEOUT)
+        return session_data
@@ -0,0 +1,73 @@
+from typing import Any, Optional, Set
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Payments, User
+from .permissions import moderator_cache_key
+from .serializers import profile_cache_key
+from .tasks import ADMIN_NOTIFY_EMAIL_CACHE_KEY
+
+# Поля пользователя, от которых зависит закэшированный email администратора
+_ADMIN_EMAIL_FIELDS = frozenset({"is_staff", "email"})
+
+
+def _invalidate_moderator_cache(user_ids: Set[int]) -> None:
+    """Сбрасывает закэшированный признак модератора у пользователей."""
+    if user_ids:
+        cache.delete_many([moderator_cache_key(user_id) for user_id in user_ids])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(
+    sender: Any, instance: Any, action: str, reverse: bool, pk_set: Optional[Set[int]], **kwargs: Any
+) -> None:
+    """
+    Сбрасывает кэш при добавлении/удалении групп пользователя.
+    Изменение может прийти с обеих сторон связи: user.groups и group.user_set.
+    """
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            _invalidate_moderator_cache({instance.pk})
+    elif action in ("post_add", "post_remove"):
+        _invalidate_moderator_cache(pk_set or set())
+    elif action == "pre_clear":
+        # После очистки состав группы уже не узнать, поэтому сбрасываем кэш заранее
+        _invalidate_moderator_cache(set(instance.user_set.values_list("pk", flat=True)))
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleted(sender: Any, instance: Group, **kwargs: Any) -> None:
+    """Сбрасывает кэш у участников удаляемой группы."""
+    _invalidate_moderator_cache(set(instance.user_set.values_list("pk", flat=True)))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def staff_user_changed(sender: Any, instance: User, **kwargs: Any) -> None:
+    """
+    Сбрасывает закэшированный email администратора, если изменился staff-пользователь
+    или пользователь, чей email сейчас лежит в кэше (например, его лишили статуса staff).
+    Сохранения, не затрагивающие is_staff и email (last_login при входе), кэш не читают.
+    """
+    update_fields = kwargs.get("update_fields")
+    if update_fields is not None and not _ADMIN_EMAIL_FIELDS.intersection(update_fields):
+        return
+    if instance.is_staff or cache.get(ADMIN_NOTIFY_EMAIL_CACHE_KEY) == instance.email:
+        cache.delete(ADMIN_NOTIFY_EMAIL_CACHE_KEY)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_profile_changed(sender: Any, instance: User, **kwargs: Any) -> None:
+    """Сбрасывает закэшированный ответ /users/me/ при изменении пользователя."""
+    cache.delete(profile_cache_key(instance.pk))
+
+
+@receiver(post_save, sender=Payments)
+@receiver(post_delete, sender=Payments)
+def user_payments_changed(sender: Any, instance: Payments, **kwargs: Any) -> None:
+    """Сбрасывает закэшированный ответ /users/me/ владельца платежа: история платежей изменилась."""
+    cache.delete(profile_cache_key(instance.user_id))
@@ -1,83 +1,178 @@
+import functools
 import logging
+import time
 from datetime import timedelta
-from typing import Optional
+from itertools import islice
+from typing import Any, Callable, List, Optional, Set, Tuple
 
-from celery import shared_task
+from celery import Task, shared_task
+from celery.utils import uuid
 from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
+from django.db import transaction
+from django.template.loader import get_template, render_to_string
 from django.utils import timezone
 from django.utils.html import strip_tags
 
 from materials.models import Course
 
 from .models import Payments, Subscription, User
+from .serializers import profile_cache_key
 
 logger = logging.getLogger(__name__)
 
+# Интервал между запусками check_payment_status, секунды
+PAYMENT_CHECK_INTERVAL = 60 * 60
+PAYMENT_CHECK_NEXT_RUN_KEY = "check_payment_status:next_run"
+# Время (unix timestamp), на которое запланирован очередной запуск цепочки
+PAYMENT_CHECK_DUE_KEY = "check_payment_status:due_at"
+
+# Количество писем в одной подзадаче рассылки
+NOTIFICATION_BATCH_SIZE = 100
+
+# Размер пакета и пауза между пакетами при удалении старых платежей, секунды
+CLEANUP_BATCH_SIZE = 5000
+CLEANUP_BATCH_PAUSE = 0.1
+
+# Кэш email администратора для служебных уведомлений
+ADMIN_NOTIFY_EMAIL_CACHE_KEY = "admin_notify_email"
+ADMIN_NOTIFY_EMAIL_CACHE_TIMEOUT = 60 * 60
+
+
+def _invalidate_profile_cache(user_ids: Set[int]) -> None:
+    """
+    Сбрасывает закэшированный ответ /users/me/ владельцев платежей.
+    Нужен массовым операциям (update, _raw_delete), которые не вызывают сигналы Payments.
+    """
+    if user_ids:
+        cache.delete_many([profile_cache_key(user_id) for user_id in user_ids])
+
+
+def locked(lock_name: str, expiry_seconds: int) -> Callable:
+    """
+    Не дает задаче выполняться параллельно: блокировка берется через cache.add
+    (SET NX EX в Redis). Если блокировка уже занята, задача сразу завершается.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            lock_key = f"lock:{lock_name}"
+            if not cache.add(lock_key, "1", timeout=expiry_seconds):
+                logger.info(f"Задача {lock_name} уже выполняется, пропускаем запуск")
+                return f"Задача {lock_name} уже выполняется"
+            try:
+                return func(*args, **kwargs)
+            finally:
+                cache.delete(lock_key)
+
+        return wrapper
+
+    return decorator
+
 
 @shared_task
 def send_course_update_notification(
     course_id: int, lesson_title: str, lesson_description: Optional[str] = None
 ) -> str:
     """
-    Асинхронная рассылка уведомлений подписчикам о новом уроке в курсе
+    Асинхронная рассылка уведомлений подписчикам о новом уроке в курсе.
+    Подписчики делятся на пакеты, которые отправляют параллельно свободные воркеры Celery.
     """
     try:
-        course = Course.objects.get(id=course_id)
-        subscriptions = Subscription.objects.filter(course=course).select_related("user")
+        # Для рассылки нужны только id и название курса
+        course = Course.objects.only("id", "title").get(id=course_id)
+        # Читаем только нужные столбцы и получаем строки порциями, не создавая модели в памяти
+        subscriptions = (
+            Subscription.objects.filter(course=course)
+            .values_list("id", "user__email", "user__first_name")
+            .iterator(chunk_size=500)
+        )
 
-        if not subscriptions:
+        course_url = f"{settings.FRONTEND_URL}/courses/{course.id}"
+        recipients_count = batches_count = 0
+        # Каждый пакет ставится в очередь сразу после чтения: в памяти не больше одного пакета,
+        # воркеры начинают отправку, пока читаются следующие подписчики
+        while batch := list(islice(subscriptions, NOTIFICATION_BATCH_SIZE)):
+            send_course_update_batch.delay(course.title, course_url, lesson_title, lesson_description, batch)
+            recipients_count += len(batch)
+            batches_count += 1
+
+        if not batches_count:
             logger.info(f"Нет подписчиков для курса {course.title}")
             return "Нет подписчиков для уведомления"
 
-        successful_sends = 0
-        failed_sends = 0
+        logger.info(f"Рассылка запущена: {recipients_count} подписчиков, пакетов: {batches_count}")
+        return f"Рассылка запущена: {recipients_count} подписчикам, пакетов: {batches_count}"
 
-        for subscription in subscriptions:
-            try:
-                user = subscription.user
+    except Course.DoesNotExist:
+        logger.error(f"Курс с ID {course_id} не найден")
+        return f"Ошибка: курс с ID {course_id} не найден"
+    except Exception as e:
+        logger.error(f"Ошибка рассылки уведомлений: {e}")
+        return f"Ошибка: {e}"
 
+
+@shared_task
+def send_course_update_batch(
+    course_title: str,
+    course_url: str,
+    lesson_title: str,
+    lesson_description: Optional[str],
+    recipients: List[Tuple[int, str, str]],
+) -> str:
+    """
+    Отправка пакета уведомлений о новом уроке.
+    recipients - список (id подписки, email, имя) из send_course_update_notification.
+    """
+    successful_sends = 0
+    failed_sends = 0
+
+    # Общие для всех писем данные готовим один раз до цикла
+    html_template = get_template("emails/course_update_notification.html")
+    # Текстовая версия рендерится из своего шаблона, без разбора HTML через strip_tags
+    text_template = get_template("emails/course_update_notification.txt")
+    subject = f'🎓 Новый урок в курсе "{course_title}"'
+    unsubscribe_url_prefix = f"{settings.FRONTEND_URL}/unsubscribe/"
+
+    # Одно SMTP-соединение на весь пакет вместо подключения и авторизации на каждое письмо
+    with get_connection() as connection:
+        for subscription_id, email, first_name in recipients:
+            try:
                 # Подготовка HTML шаблона письма
                 context = {
-                    "user_name": user.first_name or user.email,
-                    "course_title": course.title,
+                    "user_name": first_name or email,
+                    "course_title": course_title,
                     "lesson_title": lesson_title,
                     "lesson_description": lesson_description,
-                    "course_url": f"{settings.FRONTEND_URL}/courses/{course.id}",
-                    "unsubscribe_url": f"{settings.FRONTEND_URL}/unsubscribe/{subscription.id}",
+                    "course_url": course_url,
+                    "unsubscribe_url": f"{unsubscribe_url_prefix}{subscription_id}",
                 }
 
-                html_message = render_to_string("emails/course_update_notification.html", context)
-                plain_message = strip_tags(html_message)
-
-                subject = f'🎓 Новый урок в курсе "{course.title}"'
+                html_message = html_template.render(context)
+                plain_message = text_template.render(context)
 
-                send_mail(
+                message = EmailMultiAlternatives(
                     subject=subject,
-                    message=plain_message,
+                    body=plain_message,
                     from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[user.email],
-                    html_message=html_message,
-                    fail_silently=False,
+                    to=[email],
+                    connection=connection,
                 )
+                message.attach_alternative(html_message, "text/html")
+                # Письма отправляются по одному, чтобы ошибка одного адреса не срывала остальные
+                message.send(fail_silently=False)
 
                 successful_sends += 1
-                logger.debug(f"Уведомление отправлено для {user.email}")
+                logger.debug(f"Уведомление отправлено для {email}")
 
             except Exception as e:
                 failed_sends += 1
-                logger.error(f"Ошибка отправки для {subscription.user.email}: {e}")
+                logger.error(f"Ошибка отправки для {email}: {e}")
 
-        logger.info(f"Рассылка завершена. Успешно: {successful_sends}, Ошибок: {failed_sends}")
-        return f"Уведомления отправлены: {successful_sends} подписчикам, ошибок: {failed_sends}"
-
-    except Course.DoesNotExist:
-        logger.error(f"Курс с ID {course_id} не найден")
-        return f"Ошибка: курс с ID {course_id} не найден"
-    except Exception as e:
-        logger.error(f"Ошибка рассылки уведомлений: {e}")
-        return f"Ошибка: {e}"
+    logger.info(f"Пакет рассылки отправлен. Успешно: {successful_sends}, Ошибок: {failed_sends}")
+    return f"Уведомления отправлены: {successful_sends} подписчикам, ошибок: {failed_sends}"
 
 
 @shared_task
@@ -86,7 +181,7 @@ def send_welcome_email(user_id: int) -> str:
     Отправка приветственного письма новому пользователю
     """
     try:
-        user = User.objects.get(id=user_id)
+        user = User.objects.only("id", "email", "first_name").get(id=user_id)
 
         context = {
             "user_name": user.first_name or "Пользователь",
@@ -116,21 +211,35 @@ def send_welcome_email(user_id: int) -> str:
         return f"Ошибка: {e}"
 
 
-@shared_task
-def check_payment_status() -> str:
+@shared_task(bind=True)
+@locked(lock_name="check_payment_status", expiry_seconds=PAYMENT_CHECK_INTERVAL)
+def check_payment_status(self: Task) -> str:
     """
-    Проверка статуса pending платежей
+    Проверка статуса pending платежей.
+    Задача сама ставит свой следующий запуск в очередь (без Celery Beat).
     """
+    next_run_id = cache.get(PAYMENT_CHECK_NEXT_RUN_KEY)
+    if self.request.id and next_run_id and next_run_id != self.request.id:
+        # Цепочку перезапустили через schedule_payment_check, этот запуск устарел
+        logger.info("Устаревший запуск check_payment_status, пропускаем")
+        return "Запуск устарел"
+
+    started = time.monotonic()
     try:
-        pending_payments = Payments.objects.filter(
-            payment_status="pending", payment_date__lte=timezone.now() - timedelta(hours=24)
+        # Читаются только id и владельцы просроченных платежей, статус меняется одним UPDATE
+        # вместо загрузки и сохранения каждого платежа
+        expired = list(
+            Payments.objects.filter(
+                payment_status="pending", payment_date__lte=timezone.now() - timedelta(hours=24)
+            ).values_list("id", "user_id")
         )
-
         updated_count = 0
-        for payment in pending_payments:
-            payment.payment_status = "failed"
-            payment.save()
-            updated_count += 1
+        if expired:
+            updated_count = Payments.objects.filter(
+                id__in=[payment_id for payment_id, _ in expired], payment_status="pending"
+            ).update(payment_status="failed")
+            # update() не вызывает post_save, кэш профилей сбрасывается явно
+            _invalidate_profile_cache({user_id for _, user_id in expired})
 
         logger.info(f"Обновлено {updated_count} просроченных платежей")
         return f"Обновлено {updated_count} платежей"
@@ -139,6 +248,36 @@ def check_payment_status() -> str:
         logger.error(f"Ошибка проверки платежей: {e}")
         return f"Ошибка: {e}"
 
+    finally:
+        schedule_payment_check(countdown=max(0.0, PAYMENT_CHECK_INTERVAL - (time.monotonic() - started)))
+
+
+def schedule_payment_check(countdown: float = 0) -> str:
+    """
+    Ставит запуск check_payment_status в очередь через countdown секунд.
+    id запуска сохраняется в кэше, поэтому продолжается только последняя цепочка.
+    """
+    task_id = str(uuid())
+    cache.set_many({PAYMENT_CHECK_NEXT_RUN_KEY: task_id, PAYMENT_CHECK_DUE_KEY: time.time() + countdown}, timeout=None)
+    check_payment_status.apply_async(countdown=countdown, task_id=task_id)
+    return task_id
+
+
+@shared_task
+def ensure_payment_check_scheduled() -> str:
+    """
+    Страховка самопланирующейся цепочки check_payment_status, запускается Celery Beat.
+    Если очередной запуск просрочен больше чем на интервал (сообщение потеряно или воркер упал
+    до планирования следующего запуска), цепочка запускается заново.
+    """
+    due_at = cache.get(PAYMENT_CHECK_DUE_KEY)
+    if due_at is not None and time.time() < due_at + PAYMENT_CHECK_INTERVAL:
+        return "Цепочка проверки платежей активна"
+
+    task_id = schedule_payment_check()
+    logger.warning("Цепочка check_payment_status перезапущена, запуск %s", task_id)
+    return "Цепочка проверки платежей перезапущена"
+
 
 @shared_task
 def cleanup_old_data() -> str:
@@ -149,7 +288,28 @@ def cleanup_old_data() -> str:
         # Пример: удаление платежей старше 1 года со статусом failed
         old_date = timezone.now() - timedelta(days=365)
 
-        deleted_count = Payments.objects.filter(payment_status="failed", payment_date__lte=old_date).delete()[0]
+        old_payments = Payments.objects.filter(payment_status="failed", payment_date__lte=old_date)
+        deleted_count = 0
+
+        # Удаляем пакетами по CLEANUP_BATCH_SIZE в отдельных транзакциях, чтобы не держать
+        # долгие блокировки на таблице платежей и не раздувать WAL одной огромной транзакцией
+        while True:
+            rows = list(old_payments.values_list("id", "user_id")[:CLEANUP_BATCH_SIZE])
+            if not rows:
+                break
+
+            # На Payments не ссылаются внешние ключи других таблиц (каскадов нет), поэтому удаляем
+            # без загрузки строк в память, как делает QuerySet.delete().
+            # _raw_delete не вызывает post_delete, кэш профилей владельцев сбрасывается явно
+            batch = Payments.objects.filter(id__in=[payment_id for payment_id, _ in rows])
+            with transaction.atomic():
+                deleted_count += batch._raw_delete(batch.db)
+            _invalidate_profile_cache({user_id for _, user_id in rows})
+
+            if len(rows) < CLEANUP_BATCH_SIZE:
+                break
+            # Короткая пауза между пакетами дает пройти основной нагрузке
+            time.sleep(CLEANUP_BATCH_PAUSE)
 
         logger.info(f"Удалено {deleted_count} старых записей")
         return f"Удалено {deleted_count} записей"
@@ -168,24 +328,24 @@ def deactivate_inactive_users() -> str:
         # Дата месяц назад
         month_ago = timezone.now() - timedelta(days=30)
 
-        # Находим пользователей, которые не заходили более месяца и еще активны
-        inactive_users = (
+        # Находим пользователей, которые не заходили более месяца и еще активны.
+        # id и email читаются одним запросом, дальше работаем только по первичному ключу
+        inactive_users = list(
             User.objects.filter(last_login__lt=month_ago, is_active=True)
             .exclude(is_staff=True)  # Не блокируем staff пользователей
             .exclude(is_superuser=True)  # Не блокируем суперпользователей
+            .values_list("id", "email")
         )
 
-        user_count = inactive_users.count()
-
-        if user_count == 0:
+        if not inactive_users:
             logger.info("Нет неактивных пользователей для деактивации")
             return "Нет неактивных пользователей для деактивации"
 
-        # Деактивируем пользователей
-        deactivated_count = inactive_users.update(is_active=False)
+        user_ids = [user_id for user_id, _ in inactive_users]
+        deactivated_emails = [email for _, email in inactive_users]
 
-        # Логируем деактивированных пользователей
-        deactivated_emails = list(inactive_users.values_list("email", flat=True))
+        # Деактивируем пользователей
+        deactivated_count = User.objects.filter(id__in=user_ids, is_active=True).update(is_active=False)
 
         logger.info(f"Деактивировано {deactivated_count} неактивных пользователей: {deactivated_emails}")
 
@@ -202,21 +362,34 @@ def deactivate_inactive_users() -> str:
         return f"Ошибка: {e}"
 
 
+def get_admin_notify_email() -> str:
+    """
+    Возвращает email первого администратора (staff).
+    Значение кэшируется, кэш сбрасывается сигналами при изменении staff-пользователей (users/signals.py).
+    """
+    cached: Optional[str] = cache.get(ADMIN_NOTIFY_EMAIL_CACHE_KEY)
+    if cached is not None:
+        return cached
+    email: str = User.objects.filter(is_staff=True).values_list("email", flat=True).first() or ""
+    # Пустая строка тоже кэшируется, чтобы не искать отсутствующего администратора при каждом вызове
+    cache.set(ADMIN_NOTIFY_EMAIL_CACHE_KEY, email, ADMIN_NOTIFY_EMAIL_CACHE_TIMEOUT)
+    return email
+
+
 @shared_task
 def send_admin_notification(subject: str, message: str) -> str:
     """
     Отправка уведомления администратору
     """
     try:
-        # Получаем email администратора из настроек или используем первый staff email
-        admin_user = User.objects.filter(is_staff=True).first()
+        admin_email = get_admin_notify_email()
 
-        if admin_user and admin_user.email:
+        if admin_email:
             send_mail(
                 subject=subject,
                 message=message,
                 from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[admin_user.email],
+                recipient_list=[admin_email],
                 fail_silently=False,
             )
             logger.info(f"Уведомление администратору отправлено: {subject}")
@@ -1,10 +1,49 @@
+import json
+import time
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from materials.models import Course
 
 from .models import Payments, Subscription
-from .serializers import PublicUserProfileSerializer, UserCreateSerializer
+from .models import User as UserModel
+from .permissions import CanCreateContent, CanEditUserProfile, IsModerator, IsModeratorOrAdmin, IsOwnerOrModerator
+from .serializers import (
+    PaymentsReadSerializer,
+    PaymentsSerializer,
+    PublicUserProfileSerializer,
+    UserCreateSerializer,
+    profile_cache_key,
+)
+from .services.stripe_service import StripeService
+from .tasks import (
+    PAYMENT_CHECK_DUE_KEY,
+    PAYMENT_CHECK_INTERVAL,
+    PAYMENT_CHECK_NEXT_RUN_KEY,
+    check_payment_status,
+    cleanup_old_data,
+    deactivate_inactive_users,
+    ensure_payment_check_scheduled,
+    schedule_payment_check,
+    send_admin_notification,
+    send_course_update_notification,
+    send_welcome_email,
+)
 
 User = get_user_model()
 
@@ -25,6 +64,31 @@ class UserModelTests(TestCase):
         self.assertFalse(user.is_staff)
         self.assertTrue(user.is_active)
 
+    def test_password_hashed_with_argon2(self) -> None:
+        """Пароль хешируется Argon2 (в тестах по умолчанию включен быстрый хешер)"""
+        with override_settings(PASSWORD_HASHERS=settings.PRODUCTION_PASSWORD_HASHERS):
+            user = User.objects.create_user(email="argon@example.com", password="testpass123")
+            self.assertTrue(user.password.startswith("argon2$"))
+            self.assertTrue(user.check_password("testpass123"))
+
+    def test_full_name_generated_by_database(self) -> None:
+        """Полное имя вычисляется БД при save(), update() и bulk_create"""
+        user = User.objects.create_user(email="test@example.com", password="testpass123")
+        user.refresh_from_db()
+        self.assertEqual(user.full_name, "test@example.com")
+
+        user.first_name = "John"
+        user.last_name = "Doe"
+        user.save(update_fields=["first_name", "last_name"])
+        self.assertEqual(User.objects.get(pk=user.pk).full_name, "John Doe")
+
+        User.objects.filter(pk=user.pk).update(last_name="Smith")
+        User.objects.bulk_create([User(email="bulk@example.com", first_name="Jane")])
+        self.assertEqual(
+            dict(User.objects.values_list("email", "full_name")),
+            {"test@example.com": "John Smith", "bulk@example.com": "Jane"},
+        )
+
     def test_create_superuser(self) -> None:
         """Тест создания суперпользователя"""
         admin_user = User.objects.create_superuser(email="admin@example.com", password="adminpass123")
@@ -48,6 +112,48 @@ class PaymentsModelTests(TestCase):
         self.assertEqual(payment.amount, 1000)
         self.assertEqual(payment.payment_method, "card")
 
+    def test_amount_cents_generated_from_amount(self) -> None:
+        """Тест вычисления суммы в центах на стороне БД"""
+        user = User.objects.create_user(email="test@example.com", password="testpass123")
+        payment = Payments.objects.create(user=user, amount="12.34", payment_method="card")
+        payment.refresh_from_db()
+
+        self.assertEqual(payment.amount_cents, 1234)
+        total = Payments.objects.aggregate(total=Sum("amount_cents"))["total"]
+        self.assertEqual(total, 1234)
+
+    def test_blank_stripe_ids_not_unique(self) -> None:
+        """Пустые идентификаторы Stripe повторяются, заполненные остаются уникальными"""
+        admin = User.objects.create_superuser(email="admin@example.com", password="adminpass123")
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        data = {"user": admin.pk, "amount": "100.00", "stripe_session_id": "", "stripe_payment_intent_id": ""}
+
+        for _ in range(2):
+            response = client.post(reverse("users_api:payments-list"), data)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        Payments.objects.create(user=admin, amount=100, stripe_session_id="cs_dup")
+        with self.assertRaises(IntegrityError):
+            Payments.objects.create(user=admin, amount=100, stripe_session_id="cs_dup")
+
+
+class PaymentsSerializerTests(TestCase):
+    """
+    Тестирование сериализаторов платежей.
+    """
+
+    def test_read_serializer_matches_model_serializer(self) -> None:
+        """Облегченный сериализатор выводит те же данные, что и PaymentsSerializer"""
+        user = User.objects.create_user(email="test@example.com", password="testpass123")
+        payments = [
+            Payments.objects.create(user=user, amount="10.50", payment_method="card"),
+            Payments.objects.create(user=user, amount=100, payment_status="paid", stripe_session_id="cs_test"),
+        ]
+
+        for payment in payments:
+            self.assertEqual(PaymentsReadSerializer(payment).data, PaymentsSerializer(payment).data)
+
 
 class SubscriptionModelTests(TestCase):
     """
@@ -56,8 +162,6 @@ class SubscriptionModelTests(TestCase):
 
     def test_subscription_creation(self) -> None:
         """Тест создания подписки"""
-        from materials.models import Course
-
         user = User.objects.create_user(email="test@example.com", password="testpass123")
         course = Course.objects.create(title="Test Course", owner=user)
 
@@ -68,6 +172,60 @@ class SubscriptionModelTests(TestCase):
         self.assertIsNotNone(subscription.created_at)
 
 
+class SubscriptionViewSetTests(APITestCase):
+    """
+    Тестирование API подписок.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка тестовых данных (один раз на класс)"""
+        cls.user = User.objects.create_user(email="test@example.com", password="testpass123")
+        cls.course = Course.objects.create(title="Test Course", owner=cls.user)
+
+    def setUp(self) -> None:
+        self.client.force_authenticate(user=self.user)
+
+    def test_duplicate_subscription_is_idempotent(self) -> None:
+        """Повторная подписка на курс возвращает существующую подписку"""
+        response = self.client.post("/api/subscriptions/", {"course": self.course.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        subscription_id = response.data["id"]
+
+        response = self.client.post("/api/subscriptions/", {"course": self.course.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["id"], subscription_id)
+        self.assertEqual(Subscription.objects.filter(user=self.user).count(), 1)
+
+    def test_subscribe_action_rejects_repeated_subscription(self) -> None:
+        """Эндпоинт subscribe создает подписку один раз и сообщает о повторной"""
+        url = "/api/subscriptions/subscribe/"
+
+        response = self.client.post(url, {"course_id": self.course.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["course_title"], "Test Course")
+
+        response = self.client.post(url, {"course_id": self.course.pk})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Subscription.objects.filter(user=self.user).count(), 1)
+
+        response = self.client.post(url, {"course_id": 0})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unsubscribe_action_deletes_with_single_query(self) -> None:
+        """Эндпоинт unsubscribe удаляет подписку одним запросом"""
+        Subscription.objects.create(user=self.user, course=self.course)
+        url = "/api/subscriptions/unsubscribe/"
+
+        with self.assertNumQueries(1):
+            response = self.client.post(url, {"course_id": self.course.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Subscription.objects.filter(user=self.user).exists())
+
+        response = self.client.post(url, {"course_id": self.course.pk})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
 class UserSerializerTests(TestCase):
     """
     Тестирование сериализаторов пользователя.
@@ -127,10 +285,18 @@ class UserViewSetTests(APITestCase):
     Тестирование ViewSet пользователей.
     """
 
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка тестовых данных (один раз на класс)"""
+        cls.user = User.objects.create_user(email="test@example.com", password="testpass123")
+        cls.admin_user = User.objects.create_superuser(email="admin@example.com", password="adminpass123")
+        # URL разрешаются через роутер один раз на класс
+        cls.list_url = reverse("users_api:users-list")
+        cls.me_url = reverse("users_api:users-me")
+        cls.detail_url = reverse("users_api:users-detail", kwargs={"pk": cls.user.pk})
+
     def setUp(self) -> None:
-        """Подготовка тестовых данных"""
-        self.user = User.objects.create_user(email="test@example.com", password="testpass123")
-        self.admin_user = User.objects.create_superuser(email="admin@example.com", password="adminpass123")
+        cache.clear()
 
     def test_user_registration(self) -> None:
         """Тест регистрации пользователя"""
@@ -142,14 +308,556 @@ class UserViewSetTests(APITestCase):
             "last_name": "User",
         }
 
-        response = self.client.post("/api/users/", data)
+        response = self.client.post(self.list_url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(User.objects.filter(email="newuser@example.com").count(), 1)
 
     def test_get_own_profile(self) -> None:
         """Тест получения собственного профиля"""
         self.client.force_authenticate(user=self.user)
-        response = self.client.get("/api/users/me/")
+        # Пользователь уже загружен аутентификацией, читается только история платежей
+        with self.assertNumQueries(1):
+            response = self.client.get(self.me_url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["email"], "test@example.com")
+        self.assertEqual(response.json()["email"], "test@example.com")
+
+    def test_own_profile_cached_with_etag(self) -> None:
+        """Ответ /me/ берется из кэша, поддерживает If-None-Match и сбрасывается при новом платеже"""
+        self.client.force_authenticate(user=self.user)
+        etag = self.client.get(self.me_url)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.me_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Payments.objects.create(user=self.user, amount=100)
+        response = self.client.get(self.me_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.data["payments"]), 1)
+
+    def test_own_profile_prefetches_payments(self) -> None:
+        """Тест загрузки платежей профиля одним запросом"""
+        Payments.objects.bulk_create(Payments(user=self.user, amount=100) for _ in range(3))
+        self.client.force_authenticate(user=self.user)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.detail_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["payments"]), 3)
+
+    def test_own_profile_fields_param_skips_payments(self) -> None:
+        """Тест выбора полей профиля без загрузки платежей"""
+        Payments.objects.create(user=self.user, amount=100)
+        self.client.force_authenticate(user=self.user)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.detail_url, {"fields": "id,email"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {"id", "email"})
+
+    def test_admin_can_delete_user(self) -> None:
+        """Удаление пользователя через API: объект загружается целиком, сигналы не падают"""
+        victim = User.objects.create_user(email="victim@example.com", password="testpass123", is_staff=True)
+        self.client.force_authenticate(user=self.admin_user)
+
+        response = self.client.delete(reverse("users_api:users-detail", kwargs={"pk": victim.pk}))
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(User.objects.filter(pk=victim.pk).exists())
+
+    def test_users_list_loads_only_public_columns(self) -> None:
+        """Список пользователей читает только публичные столбцы без догрузки полей по строкам"""
+        self.client.force_authenticate(user=self.admin_user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.list_url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 2)
+        # COUNT для пагинации и выборка страницы
+        self.assertEqual(len(queries.captured_queries), 2)
+        self.assertNotIn("password", queries.captured_queries[-1]["sql"])
+
+
+class PermissionsTests(TestCase):
+    """
+    Тестирование классов прав доступа.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка тестовых данных (один раз на класс)"""
+        cls.moderator = User.objects.create_user(email="moderator@example.com", password="testpass123")
+        moderators_group = Group.objects.create(name="moderators")
+        cls.moderator.groups.add(moderators_group)
+        cls.regular_user = User.objects.create_user(email="regular@example.com", password="testpass123")
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def make_request(self, user: UserModel, method: str = "get") -> Request:
+        request = Request(getattr(APIRequestFactory(), method)("/"))
+        request.user = user
+        return request
+
+    def test_moderator_lookup_is_cached_per_request(self) -> None:
+        """Проверка группы модераторов выполняется один раз за запрос"""
+        request = self.make_request(self.moderator, "patch")
+
+        with self.assertNumQueries(1):
+            self.assertTrue(IsModeratorOrAdmin().has_permission(request, None))
+            self.assertFalse(CanCreateContent().has_permission(request, None))
+            self.assertTrue(CanEditUserProfile().has_object_permission(request, None, self.regular_user))
+
+    def test_is_moderator_uses_moderators_group(self) -> None:
+        """IsModerator определяет модератора по группе, как остальные классы прав; суперпользователь - не модератор"""
+        request = self.make_request(self.moderator)
+
+        self.assertTrue(IsModerator().has_permission(request, None))
+        with self.assertNumQueries(0):
+            self.assertTrue(IsModerator().has_permission(request, None))
+
+        superuser = User.objects.create_superuser(email="root@example.com", password="testpass123")
+        self.assertFalse(IsModerator().has_permission(self.make_request(superuser), None))
+
+    def test_staff_skips_moderator_lookup(self) -> None:
+        """Для администратора проверка группы модераторов не выполняется"""
+        staff = User.objects.create_user(email="staff@example.com", password="testpass123", is_staff=True)
+        request = self.make_request(staff, "patch")
+
+        with self.assertNumQueries(0):
+            self.assertTrue(CanEditUserProfile().has_object_permission(request, None, self.regular_user))
+            self.assertTrue(IsOwnerOrModerator().has_object_permission(request, None, self.regular_user))
+
+    def test_regular_user_is_not_moderator(self) -> None:
+        """Обычный пользователь не получает прав модератора"""
+        request = self.make_request(self.regular_user)
+
+        self.assertFalse(IsModerator().has_permission(request, None))
+        self.assertFalse(IsModeratorOrAdmin().has_permission(request, None))
+        self.assertTrue(CanCreateContent().has_permission(request, None))
+
+    def test_annotated_moderator_flag_skips_group_query(self) -> None:
+        """Флаг из with_moderator_flag() используется без запроса к группам"""
+        moderator = User.objects.with_moderator_flag().get(pk=self.moderator.pk)
+        regular_user = User.objects.with_moderator_flag().get(pk=self.regular_user.pk)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(IsModeratorOrAdmin().has_permission(self.make_request(moderator), None))
+            self.assertFalse(IsModeratorOrAdmin().has_permission(self.make_request(regular_user), None))
+
+    def test_group_names_use_prefetched_groups(self) -> None:
+        """Названия групп берутся из prefetch_related без дополнительного запроса"""
+        moderator = User.objects.prefetch_related("groups").get(pk=self.moderator.pk)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(IsModeratorOrAdmin().has_permission(self.make_request(moderator), None))
+
+    def test_moderator_flag_cached_between_requests(self) -> None:
+        """Признак модератора берется из кэша и сбрасывается при смене групп"""
+        self.assertTrue(IsModeratorOrAdmin().has_permission(self.make_request(self.moderator), None))
+
+        moderator = User.objects.get(pk=self.moderator.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(IsModeratorOrAdmin().has_permission(self.make_request(moderator), None))
+
+        Group.objects.get(name="moderators").user_set.remove(moderator)
+        moderator = User.objects.get(pk=self.moderator.pk)
+        self.assertFalse(IsModeratorOrAdmin().has_permission(self.make_request(moderator), None))
+
+    def test_jwt_authenticated_moderator(self) -> None:
+        """JWT-аутентификация загружает пользователя вместе с флагом модератора"""
+        response = self.client.post("/api/auth/token/", {"email": "moderator@example.com", "password": "testpass123"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get("/api/users/", HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_moderator_queryset_reuses_moderator_flag(self) -> None:
+        """get_queryset видит флаг модератора из аутентификации без запроса к группам"""
+        Payments.objects.create(user=self.regular_user, amount=100)
+        response = self.client.post("/api/auth/token/", {"email": "moderator@example.com", "password": "testpass123"})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/payments/", HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 1)
+        # Единственное обращение к группам - подзапрос EXISTS при загрузке пользователя
+        self.assertEqual(len([q for q in queries.captured_queries if "auth_group" in q["sql"]]), 1)
+
+    def test_payments_list_query_count_independent_of_rows(self) -> None:
+        """Список платежей не догружает связанные объекты для каждой строки"""
+        course = Course.objects.create(title="Test Course", owner=self.regular_user)
+        Payments.objects.bulk_create(
+            Payments(user=self.regular_user, amount=100, paid_course=course) for _ in range(5)
+        )
+        client = APIClient()
+        client.force_authenticate(user=self.regular_user)
+
+        # Первый запрос кэширует признак модератора
+        client.get("/api/payments/")
+
+        # COUNT для пагинации и выборка страницы; внешние ключи выводятся как id без JOIN
+        with self.assertNumQueries(2):
+            response = client.get("/api/payments/")
+
+        self.assertEqual(response.data["count"], 5)
+        self.assertEqual(response.data["results"][0]["paid_course"], course.pk)
+
+        # Число запросов не растет вместе с числом платежей на странице
+        Payments.objects.bulk_create(
+            Payments(user=self.regular_user, amount=100, paid_course=course) for _ in range(45)
+        )
+        with self.assertNumQueries(2):
+            response = client.get("/api/payments/")
+        self.assertEqual(len(response.data["results"]), 20)
+
+    def test_payments_export_streams_all_rows(self) -> None:
+        """Выгрузка отдает все платежи построчно без пагинации и только администраторам"""
+        Payments.objects.bulk_create(Payments(user=self.regular_user, amount=100) for _ in range(25))
+        client = APIClient()
+        client.force_authenticate(user=self.regular_user)
+        self.assertEqual(client.get("/api/payments/export/").status_code, status.HTTP_403_FORBIDDEN)
+
+        admin = User.objects.create_user(email="admin@example.com", password="testpass123", is_staff=True)
+        client.force_authenticate(user=admin)
+        response = client.get("/api/payments/export/")
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[0]["user"], self.regular_user.pk)
+        self.assertEqual(rows[0]["amount"], "100.00")
+        # Формат строки совпадает с ответом API для того же платежа
+        api_row = client.get(f"/api/payments/{rows[0]['id']}/").json()
+        self.assertEqual(rows[0], api_row)
+
+
+class PaymentTasksTests(TestCase):
+    """
+    Тестирование фоновых задач для платежей.
+    """
+
+    def test_check_payment_status_skips_when_locked(self) -> None:
+        """Задача не запускается, пока блокировка занята другим воркером"""
+        cache.add("lock:check_payment_status", "1", timeout=60)
+        try:
+            self.assertIn("уже выполняется", check_payment_status())
+        finally:
+            cache.delete("lock:check_payment_status")
+
+    def test_check_payment_status_fails_stale_payments_and_reschedules(self) -> None:
+        """Просроченные pending платежи отмечаются failed, задача ставит следующий запуск"""
+        user = User.objects.create_user(email="test@example.com", password="testpass123")
+        stale = Payments.objects.create(user=user, amount=100, payment_status="pending")
+        fresh = Payments.objects.create(user=user, amount=100, payment_status="pending")
+        Payments.objects.filter(pk=stale.pk).update(payment_date=timezone.now() - timedelta(hours=25))
+
+        cache.set(profile_cache_key(user.pk), ({}, '"etag"'))
+
+        with patch.object(check_payment_status, "apply_async") as apply_async:
+            self.assertEqual(check_payment_status(), "Обновлено 1 платежей")
+
+        self.assertIsNone(cache.get(profile_cache_key(user.pk)))
+
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.payment_status, "failed")
+        self.assertEqual(fresh.payment_status, "pending")
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs["task_id"], cache.get(PAYMENT_CHECK_NEXT_RUN_KEY))
+
+    def test_check_payment_status_skips_superseded_chain(self) -> None:
+        """Запуск из устаревшей цепочки не выполняется и не планирует следующий"""
+        cache.set(PAYMENT_CHECK_NEXT_RUN_KEY, "new-chain")
+        try:
+            with patch.object(check_payment_status, "apply_async") as apply_async:
+                result = check_payment_status.apply(task_id="old-chain")
+        finally:
+            cache.delete(PAYMENT_CHECK_NEXT_RUN_KEY)
+
+        self.assertEqual(result.get(), "Запуск устарел")
+        apply_async.assert_not_called()
+
+    def test_ensure_payment_check_scheduled_restarts_lost_chain(self) -> None:
+        """Страховочная задача перезапускает цепочку, только если очередной запуск просрочен"""
+        self.addCleanup(cache.delete_many, [PAYMENT_CHECK_NEXT_RUN_KEY, PAYMENT_CHECK_DUE_KEY])
+
+        with patch.object(check_payment_status, "apply_async") as apply_async:
+            schedule_payment_check(countdown=60)
+            self.assertIn("активна", ensure_payment_check_scheduled())
+            self.assertEqual(apply_async.call_count, 1)
+
+            cache.set(PAYMENT_CHECK_DUE_KEY, time.time() - PAYMENT_CHECK_INTERVAL - 1)
+            with self.assertLogs("users.tasks", "WARNING"):
+                self.assertIn("перезапущена", ensure_payment_check_scheduled())
+            self.assertEqual(apply_async.call_count, 2)
+            self.assertEqual(apply_async.call_args.kwargs["task_id"], cache.get(PAYMENT_CHECK_NEXT_RUN_KEY))
+
+    def test_cleanup_old_data_deletes_only_old_failed_payments(self) -> None:
+        """Удаляются только неуспешные платежи старше года"""
+        user = User.objects.create_user(email="test@example.com", password="testpass123")
+        old_failed = Payments.objects.create(user=user, amount=100, payment_status="failed")
+        old_paid = Payments.objects.create(user=user, amount=100, payment_status="paid")
+        recent_failed = Payments.objects.create(user=user, amount=100, payment_status="failed")
+        Payments.objects.filter(pk__in=[old_failed.pk, old_paid.pk]).update(
+            payment_date=timezone.now() - timedelta(days=400)
+        )
+
+        cache.set(profile_cache_key(user.pk), ({}, '"etag"'))
+
+        self.assertEqual(cleanup_old_data(), "Удалено 1 записей")
+        self.assertIsNone(cache.get(profile_cache_key(user.pk)))
+        self.assertQuerySetEqual(
+            Payments.objects.order_by("pk"), [old_paid.pk, recent_failed.pk], transform=lambda p: p.pk
+        )
+
+    @patch("users.tasks.time.sleep")
+    @patch("users.tasks.CLEANUP_BATCH_SIZE", 2)
+    def test_cleanup_old_data_deletes_in_batches(self, sleep: MagicMock) -> None:
+        """Старые платежи удаляются пакетами с паузой между ними"""
+        user = User.objects.create_user(email="test@example.com", password="testpass123")
+        Payments.objects.bulk_create(Payments(user=user, amount=100, payment_status="failed") for _ in range(3))
+        Payments.objects.update(payment_date=timezone.now() - timedelta(days=400))
+
+        self.assertEqual(cleanup_old_data(), "Удалено 3 записей")
+        self.assertFalse(Payments.objects.exists())
+        sleep.assert_called_once()
+
+
+class NotificationTasksTests(TestCase):
+    """
+    Тестирование фоновых задач рассылки уведомлений.
+    """
+
+    def test_course_update_notification_sent_to_each_subscriber(self) -> None:
+        """Каждый подписчик получает письмо с HTML-версией"""
+        owner = User.objects.create_user(email="owner@example.com", password="testpass123")
+        course = Course.objects.create(title="Test Course", owner=owner)
+        for email in ("first@example.com", "second@example.com"):
+            Subscription.objects.create(
+                user=User.objects.create_user(email=email, password="testpass123"), course=course
+            )
+
+        # Подзадачи пакетов выполняются синхронно в том же процессе
+        celery_conf = send_course_update_notification.app.conf
+        celery_conf.task_always_eager = True
+        self.addCleanup(setattr, celery_conf, "task_always_eager", False)
+
+        result = send_course_update_notification(course.id, "Новый урок")
+
+        self.assertEqual(result, "Рассылка запущена: 2 подписчикам, пакетов: 1")
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ["first@example.com", "second@example.com"])
+        self.assertTrue(all(message.alternatives for message in mail.outbox))
+        self.assertIn('В курсе "Test Course" появился новый урок', mail.outbox[0].body)
+        self.assertNotIn("<", mail.outbox[0].body)
+
+    @patch("users.tasks.NOTIFICATION_BATCH_SIZE", 2)
+    @patch("users.tasks.send_course_update_batch.delay")
+    def test_course_update_notification_dispatches_each_batch(self, batch_delay: MagicMock) -> None:
+        """Каждый прочитанный пакет подписчиков сразу ставится в очередь отдельной подзадачей"""
+        owner = User.objects.create_user(email="owner@example.com", password="testpass123")
+        course = Course.objects.create(title="Test Course", owner=owner)
+        for index in range(5):
+            Subscription.objects.create(
+                user=User.objects.create_user(email=f"user{index}@example.com", password="testpass123"), course=course
+            )
+
+        result = send_course_update_notification(course.id, "Новый урок")
+
+        self.assertEqual(result, "Рассылка запущена: 5 подписчикам, пакетов: 3")
+        self.assertEqual([len(call.args[4]) for call in batch_delay.call_args_list], [2, 2, 1])
+
+    def test_welcome_email_loads_user_once(self) -> None:
+        """Приветственное письмо отправляется после одного узкого запроса пользователя"""
+        user = User.objects.create_user(email="new@example.com", password="testpass123", first_name="Иван")
+
+        with self.assertNumQueries(1):
+            result = send_welcome_email(user.id)
+
+        self.assertEqual(result, "Приветственное письмо отправлено")
+        self.assertEqual(mail.outbox[0].to, ["new@example.com"])
+
+
+class StripeServiceTests(TestCase):
+    """
+    Тестирование сервиса Stripe (без обращения к API).
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        """Подготовка тестовых данных (один раз на класс)"""
+        owner = User.objects.create_user(email="owner@example.com", password="testpass123")
+        cls.course = Course.objects.create(title="Test Course", owner=owner, price=50)
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    @patch("users.services.stripe_service.stripe.checkout.Session.create")
+    @patch("users.services.stripe_service.stripe.Price.create")
+    @patch("users.services.stripe_service.stripe.Product.create")
+    def test_product_and_price_reused_until_price_changes(
+        self, product_create: MagicMock, price_create: MagicMock, session_create: MagicMock
+    ) -> None:
+        """Продукт создается один раз, цена - заново только при изменении цены курса"""
+        product_create.return_value.id = "prod_1"
+        price_create.return_value.id = "price_1"
+        session_create.return_value.id = "cs_1"
+        session_create.return_value.url = "https://checkout.stripe.com/cs_1"
+
+        StripeService.create_course_payment_session(self.course, user_id=1)
+        StripeService.create_course_payment_session(self.course, user_id=1)
+        self.assertEqual(product_create.call_count, 1)
+        self.assertEqual(price_create.call_count, 1)
+
+        self.course.price = 60
+        result = StripeService.create_course_payment_session(self.course, user_id=1)
+        self.assertEqual(product_create.call_count, 1)
+        self.assertEqual(price_create.call_count, 2)
+        self.assertEqual(result["price_id"], "price_1")
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.stripe_price_amount, 60)
+
+    @patch("users.views.StripeService.create_course_payment_session")
+    def test_create_course_payment_endpoint(self, create_session: MagicMock) -> None:
+        """Эндпоинт оплаты использует курс, загруженный при валидации"""
+        create_session.return_value = {"session_id": "cs_1", "url": "https://checkout.stripe.com/cs_1"}
+        user = User.objects.create_user(email="buyer@example.com", password="testpass123", is_staff=True)
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        response = client.post("/api/payments/create_course_payment/", {"course_id": self.course.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(create_session.call_args.args[0], self.course)
+        self.assertIn("preview", create_session.call_args.args[0].get_deferred_fields())
+        self.assertTrue(Payments.objects.filter(user=user, paid_course=self.course, stripe_session_id="cs_1").exists())
+
+        response = client.post("/api/payments/create_course_payment/", {"course_id": 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("course_id", response.data)
+
+    @patch("users.services.stripe_service.stripe.checkout.Session.create")
+    @patch("users.services.stripe_service.stripe.Price.create")
+    @patch("users.services.stripe_service.stripe.Product.create")
+    def test_repeated_payment_request_reuses_session(
+        self, product_create: MagicMock, price_create: MagicMock, session_create: MagicMock
+    ) -> None:
+        """Повторный запрос оплаты в течение минуты возвращает ту же сессию без нового платежа"""
+        product_create.return_value.id = "prod_1"
+        price_create.return_value.id = "price_1"
+        session_create.return_value.id = "cs_1"
+        session_create.return_value.url = "https://checkout.stripe.com/cs_1"
+        user = User.objects.create_user(email="buyer@example.com", password="testpass123", is_staff=True)
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        first = client.post("/api/payments/create_course_payment/", {"course_id": self.course.pk})
+        second = client.post("/api/payments/create_course_payment/", {"course_id": self.course.pk})
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(session_create.call_count, 1)
+        self.assertEqual(Payments.objects.filter(user=user, paid_course=self.course).count(), 1)
+
+    @patch("users.views.StripeService.create_course_payment_session")
+    def test_payment_request_conflicts_while_session_is_created(self, create_session: MagicMock) -> None:
+        """Пока параллельный запрос создает сессию, повторный получает 409 без платежа и вызова Stripe"""
+        user = User.objects.create_user(email="buyer@example.com", password="testpass123", is_staff=True)
+        client = APIClient()
+        client.force_authenticate(user=user)
+        self.assertTrue(StripeService.claim_course_payment_session(self.course.pk, user.pk))
+
+        response = client.post("/api/payments/create_course_payment/", {"course_id": self.course.pk})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        create_session.assert_not_called()
+        self.assertFalse(Payments.objects.filter(user=user).exists())
+
+    @patch("users.views.StripeService.create_course_payment_session")
+    def test_failed_payment_request_releases_claim(self, create_session: MagicMock) -> None:
+        """После ошибки Stripe ключ освобождается и следующий запрос создает сессию"""
+        create_session.side_effect = [Exception("Stripe недоступен"), {"session_id": "cs_2", "url": "https://x.io/2"}]
+        user = User.objects.create_user(email="buyer@example.com", password="testpass123", is_staff=True)
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        first = client.post("/api/payments/create_course_payment/", {"course_id": self.course.pk})
+        second = client.post("/api/payments/create_course_payment/", {"course_id": self.course.pk})
+
+        self.assertEqual(first.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data["session_id"], "cs_2")
+
+
+class DeactivateInactiveUsersTests(TestCase):
+    """
+    Тестирование задачи деактивации неактивных пользователей.
+    """
+
+    @patch("users.tasks.send_admin_notification.delay")
+    def test_deactivates_only_inactive_regular_users(self, notify: MagicMock) -> None:
+        """Деактивируются только обычные пользователи, не заходившие более месяца"""
+        long_ago = timezone.now() - timedelta(days=40)
+        inactive = User.objects.create_user(email="inactive@example.com", password="testpass123", last_login=long_ago)
+        staff = User.objects.create_user(
+            email="staff@example.com", password="testpass123", last_login=long_ago, is_staff=True
+        )
+        active = User.objects.create_user(
+            email="active@example.com", password="testpass123", last_login=timezone.now()
+        )
+
+        with self.assertNumQueries(2):
+            result = deactivate_inactive_users()
+
+        self.assertEqual(result, "Деактивировано 1 неактивных пользователей")
+        self.assertEqual(
+            list(User.objects.filter(is_active=False).values_list("pk", flat=True)),
+            [inactive.pk],
+        )
+        self.assertEqual(User.objects.filter(pk__in=[staff.pk, active.pk], is_active=True).count(), 2)
+        notify.assert_called_once()
+
+
+class AdminNotificationTests(TestCase):
+    """
+    Тестирование уведомлений администратору.
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_admin_email_is_cached(self) -> None:
+        """Повторные уведомления не запрашивают администратора из БД"""
+        User.objects.create_user(email="admin@example.com", password="testpass123", is_staff=True)
+        send_admin_notification("Тема", "Текст")
+
+        with self.assertNumQueries(0):
+            send_admin_notification("Тема", "Текст")
+
+        self.assertEqual([message.to for message in mail.outbox], [["admin@example.com"], ["admin@example.com"]])
+
+    def test_cache_reset_when_admin_loses_staff(self) -> None:
+        """Снятие статуса staff сбрасывает закэшированный email"""
+        admin = User.objects.create_user(email="admin@example.com", password="testpass123", is_staff=True)
+        send_admin_notification("Тема", "Текст")
+
+        admin.is_staff = False
+        admin.save()
+
+        with self.assertLogs("users.tasks", "WARNING"):
+            self.assertEqual(send_admin_notification("Тема", "Текст"), "Не найден email администратора")
+
+    def test_login_save_does_not_touch_admin_email_cache(self) -> None:
+        """Сохранение только last_login (вход пользователя) не читает кэш email администратора"""
+        user = User.objects.create_user(email="user@example.com", password="testpass123")
+        user.last_login = timezone.now()
+
+        with patch("users.signals.cache.get") as cache_get:
+            user.save(update_fields=["last_login"])
+
+        cache_get.assert_not_called()
@@ -1,6 +1,13 @@
+import hashlib
+import json
+import logging
 from typing import Any, Type
 
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import OpenApiParameter, OpenApiTypes, extend_schema, extend_schema_view
 from rest_framework import filters, status, viewsets
@@ -13,19 +20,36 @@ from materials.models import Course
 
 from .filters import PaymentsFilter
 from .models import Payments, Subscription, User
-from .permissions import CanEditUserProfile, IsModeratorOrAdmin
+from .permissions import CanEditUserProfile, IsModeratorOrAdmin, is_moderator
 from .serializers import (
+    PROFILE_CACHE_TIMEOUT,
     CoursePaymentSerializer,
     PaymentSessionSerializer,
+    PaymentsReadSerializer,
     PaymentsSerializer,
     PrivateUserProfileSerializer,
     PublicUserProfileSerializer,
     SubscriptionSerializer,
     UserCreateSerializer,
     UserUpdateSerializer,
+    profile_cache_key,
 )
 from .services.stripe_service import StripeService
 
+logger = logging.getLogger(__name__)
+
+# Размер порции строк, которую выгрузка платежей читает из БД за один раз
+EXPORT_CHUNK_SIZE = 2000
+
+# Параметр выбора полей собственного профиля (PrivateUserProfileSerializer)
+PROFILE_FIELDS_PARAMETER = OpenApiParameter(
+    name="fields",
+    type=OpenApiTypes.STR,
+    location=OpenApiParameter.QUERY,
+    description="Поля собственного профиля через запятую (например, id,email)."
+    " История платежей загружается, только если запрошено поле payments.",
+)
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -38,6 +62,7 @@ from .services.stripe_service import StripeService
         description="Получить детальную информацию о пользователе./n"
         " Публичные данные для всех авторизованных пользователей, приватные только для владельца профиля.",
         tags=["users"],
+        parameters=[PROFILE_FIELDS_PARAMETER],
     ),
     create=extend_schema(
         summary="Регистрация пользователя",
@@ -68,7 +93,28 @@ class UserViewSet(viewsets.ModelViewSet):
     - При просмотре чужого профиля показывается ограниченная информация
     """
 
-    queryset = User.objects.all().prefetch_related("payments")
+    queryset = User.objects.all()
+
+    # Классы прав по действиям; остальные действия (retrieve, me, update_me) - IsAuthenticated
+    PERMISSION_CLASSES_BY_ACTION = {
+        "create": (AllowAny,),
+        "list": (IsAuthenticated, IsModeratorOrAdmin),
+        "update": (IsAuthenticated, CanEditUserProfile),
+        "partial_update": (IsAuthenticated, CanEditUserProfile),
+        "destroy": (IsAuthenticated, CanEditUserProfile),
+    }
+
+    # Сериализаторы по действиям; retrieve выбирается отдельно, остальные - публичный профиль
+    SERIALIZER_CLASSES_BY_ACTION = {
+        "create": UserCreateSerializer,
+        "update": UserUpdateSerializer,
+        "partial_update": UserUpdateSerializer,
+        "update_me": UserUpdateSerializer,
+        "me": PrivateUserProfileSerializer,
+    }
+
+    # Действия только на чтение, для которых сериализатор сужает и дополняет queryset
+    EAGER_LOADING_ACTIONS = frozenset({"list", "retrieve"})
 
     def get_permissions(self) -> list:
         """
@@ -78,33 +124,15 @@ class UserViewSet(viewsets.ModelViewSet):
         - Просмотр профиля: любой авторизованный пользователь
         - Редактирование: владелец профиля, модераторы, админы
         """
-        if self.action == "create":
-            return [AllowAny()]
-        elif self.action == "list":
-            return [IsAuthenticated(), IsModeratorOrAdmin()]
-        elif self.action in ["retrieve"]:
-            return [IsAuthenticated()]
-        elif self.action in ["update", "partial_update", "destroy"]:
-            return [IsAuthenticated(), CanEditUserProfile()]
-        elif self.action in ["me", "update_me"]:
-            return [IsAuthenticated()]
-        return [IsAuthenticated()]
+        permission_classes = self.PERMISSION_CLASSES_BY_ACTION.get(self.action, (IsAuthenticated,))
+        return [permission() for permission in permission_classes]
 
     def get_serializer_class(self) -> Type:
         """Выбираем сериализатор в зависимости от действия и контекста"""
-        if self.action == "create":
-            return UserCreateSerializer
-        elif self.action in ["update", "partial_update", "update_me"]:
-            return UserUpdateSerializer
-        elif self.action == "retrieve":
-            # Определяем какой сериализатор использовать для просмотра
-            if self.is_own_profile():
-                return PrivateUserProfileSerializer
-            else:
-                return PublicUserProfileSerializer
-        elif self.action in ["me"]:
-            return PrivateUserProfileSerializer
-        return PublicUserProfileSerializer
+        if self.action == "retrieve":
+            # Свой профиль показываем полностью, чужой - только публичные данные
+            return PrivateUserProfileSerializer if self.is_own_profile() else PublicUserProfileSerializer
+        return self.SERIALIZER_CLASSES_BY_ACTION.get(self.action, PublicUserProfileSerializer)
 
     def get_queryset(self) -> QuerySet[User]:
         """
@@ -116,51 +144,76 @@ class UserViewSet(viewsets.ModelViewSet):
         if not user.is_authenticated:
             return User.objects.none()
 
-        if user.is_staff:
-            return User.objects.all().prefetch_related("payments")
-        elif self.action == "list":
+        if self.action == "list" and not user.is_staff:
             # Обычные пользователи не видят список всех пользователей
             return User.objects.none()
-        else:
-            return User.objects.all().prefetch_related("payments")
+
+        queryset = User.objects.all()
+        if self.action not in self.EAGER_LOADING_ACTIONS:
+            # Изменяемый объект загружается целиком: сигналы post_save/post_delete читают is_staff и email
+            return queryset
+
+        # Связанные данные подгружает сам сериализатор, который будет их выводить
+        setup_eager_loading = getattr(self.get_serializer_class(), "setup_eager_loading", None)
+        return setup_eager_loading(queryset, self.request) if setup_eager_loading else queryset
 
     def is_own_profile(self) -> bool:
         """
         Проверяет, запрашивает ли пользователь свой собственный профиль.
+        Вызывается из get_serializer_class и retrieve, поэтому результат запоминается
+        на экземпляре представления (он создается заново на каждый запрос).
         """
-        try:
-            if not hasattr(self, "kwargs") or "pk" not in self.kwargs:
-                return False
-
-            profile_id = self.kwargs["pk"]
-
-            # Обрабатываем случай, когда pk = 'me'
-            if profile_id == "me":
-                return True
-
-            # Проверяем, что пользователь аутентифицирован
-            if not self.request.user.is_authenticated:
-                return False
+        own_profile = getattr(self, "_own_profile", None)
+        if own_profile is None:
+            own_profile = self._own_profile = self._check_own_profile()
+        return own_profile
+
+    def _check_own_profile(self) -> bool:
+        profile_id = getattr(self, "kwargs", {}).get("pk")
+        if profile_id is None:
+            return False
 
-            # Явное преобразование и сравнение
-            user_id: int = self.request.user.id
-            profile_id_int: int = int(profile_id)
-            return user_id == profile_id_int
+        # Обрабатываем случай, когда pk = 'me'
+        if profile_id == "me":
+            return True
 
-        except (ValueError, TypeError):
+        # Проверяем, что пользователь аутентифицирован
+        if not self.request.user.is_authenticated:
             return False
 
+        # Нечисловой pk не может быть id пользователя; проверка isdecimal дешевле исключения от int()
+        profile_id = str(profile_id)
+        return profile_id.isdecimal() and self.request.user.id == int(profile_id)
+
     @extend_schema(
         summary="Получить текущего пользователя",
         description="Получить полную информацию о текущем аутентифицированном пользователе.",
         tags=["users"],
         responses={200: PrivateUserProfileSerializer},
+        parameters=[PROFILE_FIELDS_PARAMETER],
     )
     @action(detail=False, methods=["get"])
     def me(self, request: Request) -> Response:
-        """Эндпоинт для получения текущего пользователя (полная информация)"""
-        serializer = self.get_serializer(request.user)
-        return Response(serializer.data)
+        """
+        Эндпоинт для получения текущего пользователя (полная информация).
+        Полный ответ кэшируется вместе с ETag; при совпадении If-None-Match возвращается 304.
+        """
+        # Ответы с ?fields= редки и не кэшируются
+        if "fields" in request.query_params:
+            return Response(self.get_serializer(request.user).data)
+
+        key = profile_cache_key(request.user.pk)
+        cached = cache.get(key)
+        if cached is None:
+            data = dict(self.get_serializer(request.user).data)
+            body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode()
+            cached = (data, quote_etag(hashlib.md5(body, usedforsecurity=False).hexdigest()))
+            cache.set(key, cached, PROFILE_CACHE_TIMEOUT)
+
+        data, etag = cached
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(data, headers={"ETag": etag})
 
     @extend_schema(
         summary="Обновить текущего пользователя",
@@ -186,7 +239,7 @@ class UserViewSet(viewsets.ModelViewSet):
 
         # Логируем просмотр чужого профиля
         if not self.is_own_profile():
-            print(f"Пользователь {request.user.email} просматривает профиль {instance.email}")
+            logger.info("Пользователь %s просматривает профиль %s", request.user.email, instance.email)
 
         return Response(serializer.data)
 
@@ -247,15 +300,20 @@ class PaymentsViewSet(viewsets.ModelViewSet):
     ordering_fields = ["payment_date", "amount"]
     ordering = ["-payment_date"]
 
+    # Классы прав по действиям; остальные действия доступны только администраторам
+    PERMISSION_CLASSES_BY_ACTION = {
+        "list": (IsAuthenticated,),
+        "retrieve": (IsAuthenticated,),
+    }
+
     def get_permissions(self) -> list:
         """
         Права доступа для платежей:
         - Просмотр: владелец платежа, модераторы, админы
         - Создание/изменение/удаление: админы
         """
-        if self.action in ["list", "retrieve"]:
-            return [IsAuthenticated()]
-        return [IsAdminUser()]
+        permission_classes = self.PERMISSION_CLASSES_BY_ACTION.get(self.action, (IsAdminUser,))
+        return [permission() for permission in permission_classes]
 
     def get_queryset(self) -> QuerySet[Payments]:
         """
@@ -266,10 +324,15 @@ class PaymentsViewSet(viewsets.ModelViewSet):
         if not user.is_authenticated:
             return Payments.objects.none()
 
-        if user.is_staff or user.groups.filter(name="moderators").exists():
-            return Payments.objects.all()
+        if user.is_staff or is_moderator(self.request):
+            queryset = Payments.objects.all()
         else:
-            return Payments.objects.filter(user=user)
+            queryset = Payments.objects.filter(user=user)
+
+        if self.action in ("list", "retrieve", "export"):
+            # Для чтения загружаем только столбцы, которые выводит сериализатор
+            queryset = queryset.only(*PaymentsSerializer.Meta.fields)
+        return queryset
 
     def perform_create(self, serializer: PaymentsSerializer) -> None:
         """Автоматически назначаем пользователя при создании платежа"""
@@ -278,23 +341,26 @@ class PaymentsViewSet(viewsets.ModelViewSet):
         else:
             serializer.save()
 
-    def create(self, request: Request, *args: Any, **kwargs: Any) -> Response:
-        return super().create(request, *args, **kwargs)
-
-    def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
-        return super().list(request, *args, **kwargs)
-
-    def retrieve(self, request: Request, *args: Any, **kwargs: Any) -> Response:
-        return super().retrieve(request, *args, **kwargs)
-
-    def update(self, request: Request, *args: Any, **kwargs: Any) -> Response:
-        return super().update(request, *args, **kwargs)
-
-    def partial_update(self, request: Request, *args: Any, **kwargs: Any) -> Response:
-        return super().partial_update(request, *args, **kwargs)
-
-    def destroy(self, request: Request, *args: Any, **kwargs: Any) -> Response:
-        return super().destroy(request, *args, **kwargs)
+    @extend_schema(
+        summary="Выгрузка платежей",
+        description="Потоковая выгрузка всех платежей без пагинации в формате NDJSON (JSON-объект на строку)./n"
+        " Поддерживает те же фильтры и сортировку, что и список. Только для администраторов.",
+        tags=["payments"],
+        responses={(200, "application/x-ndjson"): OpenApiTypes.STR},
+    )
+    @action(detail=False, methods=["get"])
+    def export(self, request: Request) -> StreamingHttpResponse:
+        """
+        Выгрузка платежей построчно: строки читаются из БД порциями через iterator()
+        и сразу отдаются клиенту, поэтому память не растет с числом платежей.
+        """
+        payments = self.filter_queryset(self.get_queryset()).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        # Строки форматируются тем же сериализатором и кодируются тем же JSON-рендерером, что и ответы API,
+        # поэтому даты и суммы в выгрузке совпадают со списком платежей
+        serializer = PaymentsReadSerializer()
+        renderer = self.renderer_classes[0]()
+        lines = (renderer.render(serializer.to_representation(payment)) + b"\n" for payment in payments)
+        return StreamingHttpResponse(lines, content_type="application/x-ndjson")
 
     @extend_schema(
         summary="Создать сессию оплаты курса",
@@ -311,12 +377,21 @@ class PaymentsViewSet(viewsets.ModelViewSet):
         serializer = CoursePaymentSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        course_id = serializer.validated_data["course_id"]
+        # Курс уже загружен и проверен сериализатором
+        course = serializer.validated_data["course"]
         user = request.user
 
-        try:
-            course = Course.objects.get(id=course_id)
+        # Ключ занимается до создания платежа: из одновременных запросов (двойное нажатие) проходит один,
+        # остальные получают уже созданную сессию или 409, пока первый запрос еще выполняется
+        if not StripeService.claim_course_payment_session(course.id, user.id):
+            recent_session = StripeService.get_recent_course_payment_session(course.id, user.id)
+            if recent_session is None:
+                return Response(
+                    {"error": "Сессия оплаты уже создается, повторите запрос позже"}, status=status.HTTP_409_CONFLICT
+                )
+            return Response(PaymentSessionSerializer(recent_session).data)
 
+        try:
             # Создаем запись о платеже
             payment = Payments.objects.create(
                 user=user,
@@ -335,9 +410,9 @@ class PaymentsViewSet(viewsets.ModelViewSet):
 
             return Response(PaymentSessionSerializer(session_data).data)
 
-        except Course.DoesNotExist:
-            return Response({"error": "Курс не найден"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
+            # Следующий запрос сможет создать сессию заново
+            StripeService.release_course_payment_session(course.id, user.id)
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -358,7 +433,10 @@ class PaymentsViewSet(viewsets.ModelViewSet):
         ],
     ),
     create=extend_schema(
-        summary="Создание подписки", description="Создать новую подписку на курс.", tags=["subscriptions"]
+        summary="Создание подписки",
+        description="Создать новую подписку на курс. Если подписка уже есть, она возвращается со статусом 200.",
+        tags=["subscriptions"],
+        responses={201: SubscriptionSerializer, 200: SubscriptionSerializer},
     ),
     destroy=extend_schema(
         summary="Удаление подписки",
@@ -388,6 +466,14 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
 
         return Subscription.objects.filter(user=self.request.user)
 
+    def create(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        """Повторная подписка возвращает существующую подписку со статусом 200 вместо ошибки"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        response_status = status.HTTP_201_CREATED if serializer.created else status.HTTP_200_OK
+        return Response(serializer.data, status=response_status, headers=self.get_success_headers(serializer.data))
+
     def perform_create(self, serializer: SubscriptionSerializer) -> None:
         """Автоматически назначаем пользователя при создании подписки"""
         serializer.save(user=self.request.user)
@@ -402,26 +488,23 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["post"])
     def subscribe(self, request: Request) -> Response:
         """Эндпоинт для подписки на курс"""
-        global Course
         course_id = request.data.get("course_id")
 
         if not course_id:
             return Response({"error": "course_id обязателен"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            from materials.models import Course
-
-            course = Course.objects.get(id=course_id)
+            # Сериализатору подписки из курса нужно только название
+            course = Course.objects.only("id", "title").get(id=course_id)
         except Course.DoesNotExist:
             return Response({"error": "Курс не найден"}, status=status.HTTP_404_NOT_FOUND)
 
-        # Проверяем, не подписан ли уже пользователь
-        if Subscription.objects.filter(user=request.user, course=course).exists():
+        # get_or_create опирается на unique_together (user, course), поэтому одновременные запросы
+        # не создадут дубликат, а отдельная проверка exists() не нужна
+        subscription, created = Subscription.objects.get_or_create(user=request.user, course=course)
+        if not created:
             return Response({"error": "Вы уже подписаны на этот курс"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Создаем подписку
-        subscription = Subscription.objects.create(user=request.user, course=course)
-
         serializer = self.get_serializer(subscription)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -440,10 +523,9 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
         if not course_id:
             return Response({"error": "course_id обязателен"}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            subscription = Subscription.objects.get(user=request.user, course_id=course_id)
-        except Subscription.DoesNotExist:
+        # Один DELETE без загрузки строки: число удаленных записей показывает, была ли подписка
+        deleted, _ = Subscription.objects.filter(user=request.user, course_id=course_id).delete()
+        if not deleted:
             return Response({"error": "Подписка не найдена"}, status=status.HTTP_404_NOT_FOUND)
 
-        subscription.delete()
         return Response({"message": "Вы успешно отписались от курса"}, status=status.HTTP_200_OK)